@@ -1,13 +1,15 @@
 import aiohttp
+import asyncio
 import logging
 import config
 from config import get_config, load_token, save_token
+from esi import esi_client
+from names import name_resolver
+from registry import registry
 from urllib.parse import quote
 import base64
 from datetime import datetime, timedelta, timezone
 import json
-import os
-import requests
 
 logging.basicConfig(level=logging.INFO)
 
@@ -88,37 +90,36 @@ async def refresh_token(server_id, corporation_id):
         'Host': 'login.eveonline.com'
     }
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post('https://login.eveonline.com/v2/oauth/token', data=data, headers=headers) as response:
-                if response.status != 200:
-                    response_text = await response.text()
-                    logging.error(f"Failed to refresh access token for server ID {server_id}, corporation ID {corporation_id}. Status: {response.status}, Response: {response_text}. Refresh token used: {refresh_token}")
-                    return {}
-
-                response_data = await response.json()
-
-                access_token = response_data.get('access_token')
-                if not access_token:
-                    logging.error(f"Failed to refresh access token for server ID {server_id}, corporation ID {corporation_id}. No access token in response. Refresh token used: {refresh_token}")
-                    return {}
-
-                # Preserve existing character_id if not provided in response
-                existing_character_id = token_data.get('character_id', '')
-
-                new_refresh_token = response_data.get('refresh_token', refresh_token)  # Use existing refresh token if new one is not provided
-                expires_in = response_data.get('expires_in', 3600)  # Default to 3600 if not provided
-                created_at = datetime.utcnow().isoformat() + "Z"  # Set the current UTC time for 'created_at'
-                character_id = response_data.get('character_id', existing_character_id)  # Preserve existing character_id
-
-                logging.debug(f"New access token for server ID {server_id}, corporation ID {corporation_id}")
-
-                # Save the tokens with the updated values
-                config.save_token(server_id, corporation_id, access_token, new_refresh_token, expires_in, created_at, character_id)
-                return response_data
-        except aiohttp.ClientError as e:
-            logging.error(f"Exception occurred while refreshing access token for server ID {server_id}, corporation ID {corporation_id}: {str(e)}. Refresh token used: {refresh_token}")
-            return {}
+    try:
+        async with esi_client.post('https://login.eveonline.com/v2/oauth/token', data=data, headers=headers) as response:
+            if response.status != 200:
+                response_text = await response.text()
+                logging.error(f"Failed to refresh access token for server ID {server_id}, corporation ID {corporation_id}. Status: {response.status}, Response: {response_text}. Refresh token used: {refresh_token}")
+                return {}
+
+            response_data = await response.json()
+
+            access_token = response_data.get('access_token')
+            if not access_token:
+                logging.error(f"Failed to refresh access token for server ID {server_id}, corporation ID {corporation_id}. No access token in response. Refresh token used: {refresh_token}")
+                return {}
+
+            # Preserve existing character_id if not provided in response
+            existing_character_id = token_data.get('character_id', '')
+
+            new_refresh_token = response_data.get('refresh_token', refresh_token)  # Use existing refresh token if new one is not provided
+            expires_in = response_data.get('expires_in', 3600)  # Default to 3600 if not provided
+            created_at = datetime.utcnow().isoformat() + "Z"  # Set the current UTC time for 'created_at'
+            character_id = response_data.get('character_id', existing_character_id)  # Preserve existing character_id
+
+            logging.debug(f"New access token for server ID {server_id}, corporation ID {corporation_id}")
+
+            # Save the tokens with the updated values
+            config.save_token(server_id, corporation_id, access_token, new_refresh_token, expires_in, created_at, character_id)
+            return response_data
+    except aiohttp.ClientError as e:
+        logging.error(f"Exception occurred while refreshing access token for server ID {server_id}, corporation ID {corporation_id}: {str(e)}. Refresh token used: {refresh_token}")
+        return {}
 
 async def refresh_all_tokens():
     """Refresh all tokens for all servers and corporations."""
@@ -148,20 +149,20 @@ async def refresh_all_tokens():
     except Exception as e:
         logging.error(f"refresh_all_tokens failed with error: {str(e)}")
 
-def get_character_info(access_token):
+async def get_character_info(access_token):
     url = 'https://esi.evetech.net/verify/'
     headers = {
         'Authorization': f'Bearer {access_token}'
     }
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        async with esi_client.get(url, headers=headers) as response:
+            response.raise_for_status()
+            return await response.json()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logging.error(f"Error retrieving character info: {e}")
         return None
 
-def get_corporation_id(character_id, access_token):
+async def get_corporation_id(character_id, access_token):
     """Retrieve the corporation ID associated with the character."""
     url = f'https://esi.evetech.net/latest/characters/{character_id}/'
     headers = {
@@ -169,9 +170,9 @@ def get_corporation_id(character_id, access_token):
     }
     
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        character_info = response.json()
+        async with esi_client.get(url, headers=headers) as response:
+            response.raise_for_status()
+            character_info = await response.json()
 
         corporation_id = character_info.get('corporation_id')
         if corporation_id:
@@ -181,21 +182,18 @@ def get_corporation_id(character_id, access_token):
         
         return corporation_id
 
-    except requests.exceptions.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logging.error(f"Error retrieving corporation ID: {e}")
         return None
 
 async def fetch_corporation_name(corporation_id):
-    """Fetch the corporation name from EVE ESI API."""
-    url = f"https://esi.evetech.net/latest/corporations/{corporation_id}/"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data.get('name', f"Corporation {corporation_id}")
-            else:
-                logging.error(f"Failed to fetch corporation name for ID {corporation_id}. Status code: {response.status}")
-                return f"Corporation {corporation_id}"
+    """Fetch the corporation name through the persistent name cache."""
+    names = await name_resolver.resolve([corporation_id])
+    name = names.get(int(corporation_id))
+    if not name:
+        logging.error(f"Failed to fetch corporation name for ID {corporation_id}.")
+        return f"Corporation {corporation_id}"
+    return name
             
 def get_latest_token(server_id):
     tokens = load_token(server_id, None)  # Assuming `None` if corporation_id is not used
@@ -209,20 +207,9 @@ def get_latest_token(server_id):
     return None
 
 def extract_corporation_id_from_filename(server_id):
-    """Extract the corporation ID from the filename pattern serverid_corporationid.json."""
-    files = [f for f in os.listdir() if f.startswith(f"{server_id}_") and f.endswith("_token.json")]
-    if not files:
+    """Return the corporation ID of the server's first stored token."""
+    corporation_id = registry.first_corporation(server_id)
+    if not corporation_id:
         logging.error(f"No token file found for server {server_id}.")
         return None
-    
-    # Extract corporation_id from the first matching file
-    filename = files[0]
-    try:
-        parts = filename.split('_')
-        if len(parts) >= 2:
-            corporation_id = parts[1]
-            return corporation_id
-    except IndexError:
-        logging.error(f"Error extracting corporation ID from filename {filename}.")
-    
-    return None
\ No newline at end of file
+    return corporation_id
\ No newline at end of file
@@ -0,0 +1,92 @@
+import logging
+import discord
+
+logging.basicConfig(level=logging.INFO)
+
+# Discord limits for embeds
+EMBED_TITLE_LIMIT = 256
+EMBED_DESCRIPTION_LIMIT = 4096
+EMBED_TOTAL_LIMIT = 6000  # All embeds of one message together
+EMBEDS_PER_MESSAGE = 10
+
+DIGEST_TITLE = "Moon drill alerts"
+DIGEST_COLOUR = discord.Colour.orange()
+
+
+class AlertDigest:
+    """Collects the alerts of one channel and sends them as few messages as possible.
+
+    Every alert becomes one line. Lines are packed into embed descriptions
+    (up to 4096 characters) and embeds into messages (up to 10 embeds and
+    6000 characters per message), so a burst of alerts costs one or two
+    API calls instead of one message per structure and alert type.
+    """
+
+    def __init__(self, title=DIGEST_TITLE):
+        self.title = title[:EMBED_TITLE_LIMIT]
+        self.lines = []
+        self.alert_keys = []  # (server_id, structure_id, alert_type, level) of the alerts in this digest
+
+    def __len__(self):
+        return len(self.lines)
+
+    def add_alert(self, structure_name, alert_type, amount, days, hours, key=None):
+        if key is not None:
+            self.alert_keys.append(key)
+        label = alert_type.replace('_', ' ').title()
+        self.add_line(f"**{structure_name}**: {label} is running low! ***{amount}*** left, runs out in {days} Days {hours} Hours")
+
+    def add_line(self, line):
+        # A single line must always fit into one embed
+        self.lines.append(line[:EMBED_DESCRIPTION_LIMIT])
+
+    def build_embeds(self):
+        """Return the digest as a list of messages, each a list of embeds within Discord's limits."""
+        # Room for a " (12/34)" counter in every title
+        title_size = len(self.title) + 10
+
+        messages = []  # Each message is a list of embed descriptions
+        descriptions = []
+        current = []
+        size = 0
+        message_size = 0
+        for line in self.lines:
+            added = len(line) + (1 if current else 0)
+            if current and (size + added > EMBED_DESCRIPTION_LIMIT or message_size + title_size + size + added > EMBED_TOTAL_LIMIT):
+                descriptions.append("\n".join(current))
+                message_size += title_size + size
+                current, size, added = [], 0, len(line)
+                if len(descriptions) >= EMBEDS_PER_MESSAGE or message_size + title_size + added > EMBED_TOTAL_LIMIT:
+                    messages.append(descriptions)
+                    descriptions, message_size = [], 0
+            current.append(line)
+            size += added
+        if current:
+            descriptions.append("\n".join(current))
+        if descriptions:
+            messages.append(descriptions)
+
+        count = sum(len(descriptions) for descriptions in messages)
+        result = []
+        index = 0
+        for descriptions in messages:
+            embeds = []
+            for description in descriptions:
+                index += 1
+                title = self.title if count == 1 else f"{self.title} ({index}/{count})"
+                embeds.append(discord.Embed(title=title[:EMBED_TITLE_LIMIT], description=description, colour=DIGEST_COLOUR))
+            result.append(embeds)
+        return result
+
+    async def send(self, channel):
+        """Send the digest to a channel. Returns the number of messages sent.
+
+        Raises discord.HTTPException if Discord rejects a message.
+        """
+        if not self.lines:
+            return 0
+        messages = self.build_embeds()
+        for embeds in messages:
+            await channel.send(embeds=embeds)
+        logging.info(f"Sent alert digest to channel {channel.id} in {len(messages)} messages.")
+        return len(messages)
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import time
+from config import get_config
+
+logging.basicConfig(level=logging.INFO)
+
+ALERT_STATE_FILE = 'alert_state.log'
+COMPACT_FACTOR = 4  # Compact once the log has this many lines per live key
+COMPACT_MIN_LINES = 1000
+
+
+class AlertStateStore:
+    """Durable alert bookkeeping: last alert sent and next check time.
+
+    Every change is appended to an append-only JSON lines log, so a write
+    costs one short line instead of rewriting a file. On startup the log is
+    replayed and compacted to one line per live key; alerts older than
+    `retention` seconds are dropped then, since they no longer suppress
+    anything. While running, the log is compacted again whenever it has
+    grown to COMPACT_FACTOR lines per live key, so rescheduling keeps it
+    bounded.
+
+    Alerts are keyed by server as well, so two guilds tracking the same
+    corporation each get their own alerts.
+    """
+
+    def __init__(self, path=ALERT_STATE_FILE, retention=7 * 86400):
+        self.path = path
+        self.retention = retention
+        self.last_alerts = {}  # (server_id, structure_id, alert_type, level) -> unix time
+        self.next_checks = {}  # (server_id, corporation_id) -> unix time
+        self._file = None
+        self._lines = 0  # Lines in the log since the last compaction
+
+    def load(self):
+        """Replay and compact the log. Call once before using the store."""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as file:
+                    for line in file:
+                        self._apply(line)
+            except IOError as e:
+                logging.error(f"Error loading alert state from {self.path}: {e}")
+        self.compact()
+        logging.info(f"Alert state loaded ({len(self.last_alerts)} alerts, {len(self.next_checks)} check deadlines).")
+
+    def _apply(self, line):
+        try:
+            record = json.loads(line)
+            if record['kind'] == 'alert':
+                # Records written before alerts were keyed by server lack server_id and are skipped
+                self.last_alerts[(record['server_id'], record['structure_id'], record['alert_type'], record['level'])] = record['time']
+            elif record['kind'] == 'next_check':
+                self.next_checks[(record['server_id'], record['corporation_id'])] = record['time']
+            elif record['kind'] == 'forget':
+                self.next_checks.pop((record['server_id'], record['corporation_id']), None)
+        except (ValueError, KeyError, TypeError):
+            # A torn last line after a crash is expected, skip it
+            logging.debug(f"Skipping invalid alert state line: {line!r}")
+
+    def _records(self):
+        for (server_id, structure_id, alert_type, level), sent_at in self.last_alerts.items():
+            yield {'kind': 'alert', 'server_id': server_id, 'structure_id': structure_id, 'alert_type': alert_type, 'level': level, 'time': sent_at}
+        for (server_id, corporation_id), next_check in self.next_checks.items():
+            yield {'kind': 'next_check', 'server_id': server_id, 'corporation_id': corporation_id, 'time': next_check}
+
+    def compact(self):
+        """Rewrite the log with only the current state."""
+        cutoff = time.time() - self.retention
+        self.last_alerts = {key: sent_at for key, sent_at in self.last_alerts.items() if sent_at >= cutoff}
+
+        self.close()
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w') as file:
+                for record in self._records():
+                    file.write(json.dumps(record) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+            self._lines = len(self.last_alerts) + len(self.next_checks)
+        except IOError as e:
+            logging.error(f"Error compacting alert state {self.path}: {e}")
+
+    def _append(self, record):
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            self._lines += 1
+        except IOError as e:
+            logging.error(f"Error writing alert state to {self.path}: {e}")
+            return
+        if self._lines > max(COMPACT_MIN_LINES, COMPACT_FACTOR * (len(self.last_alerts) + len(self.next_checks))):
+            self.compact()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def last_alert(self, server_id, structure_id, alert_type, level):
+        """Unix time the alert was last sent to the server, or None."""
+        return self.last_alerts.get((str(server_id), str(structure_id), alert_type, level))
+
+    def record_alert(self, server_id, structure_id, alert_type, level, sent_at=None):
+        sent_at = time.time() if sent_at is None else sent_at
+        self.last_alerts[(str(server_id), str(structure_id), alert_type, level)] = sent_at
+        self._append({'kind': 'alert', 'server_id': str(server_id), 'structure_id': str(structure_id), 'alert_type': alert_type, 'level': level, 'time': sent_at})
+
+    def next_check(self, server_id, corporation_id):
+        return self.next_checks.get((str(server_id), str(corporation_id)))
+
+    def set_next_check(self, server_id, corporation_id, when):
+        key = (str(server_id), str(corporation_id))
+        if self.next_checks.get(key) == when:
+            return
+        self.next_checks[key] = when
+        self._append({'kind': 'next_check', 'server_id': key[0], 'corporation_id': key[1], 'time': when})
+
+    def forget(self, server_id, corporation_id):
+        key = (str(server_id), str(corporation_id))
+        if self.next_checks.pop(key, None) is not None:
+            self._append({'kind': 'forget', 'server_id': key[0], 'corporation_id': key[1]})
+
+
+alert_state = AlertStateStore(get_config('alert_state_file', ALERT_STATE_FILE))
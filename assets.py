@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from administration import get_access_token
+from config import get_config, load_server_structures
+from esi import esi_client
+
+logging.basicConfig(level=logging.INFO)
+
+# Location flags of a Metenox drill's fuel bay and moon material bay
+DRILL_LOCATION_FLAGS = {'StructureFuel', 'MoonMaterialBay'}
+
+def make_drill_asset_filter(drill_ids):
+    """Build a row filter keeping only assets inside a known drill or in a drill bay."""
+    drill_ids = set(drill_ids)
+
+    def keep(asset):
+        return asset.get('location_id') in drill_ids or asset.get('location_flag') in DRILL_LOCATION_FLAGS
+
+    return keep
+
+def index_assets_by_location(assets):
+    """Build a location_id -> [assets] dict in a single pass over the asset list."""
+    index = {}
+    for asset in assets:
+        location_id = asset.get('location_id')
+        location_assets = index.get(location_id)
+        if location_assets is None:
+            index[location_id] = [asset]
+        else:
+            location_assets.append(asset)
+    return index
+
+def group_assets_by_location(index, location_ids=None, flags=None):
+    """Pick the requested locations out of a location index.
+
+    location_ids limits the result to those locations (all locations if None),
+    flags keeps only assets whose location_flag is in the given set. Locations
+    without any matching asset are left out. Runs in O(len(location_ids) + matches)
+    thanks to the dict index, instead of rescanning the asset list per location.
+    """
+    if location_ids is None:
+        location_ids = index.keys()
+    if flags is not None and not isinstance(flags, (set, frozenset)):
+        flags = set(flags)
+
+    grouped = {}
+    for location_id in set(location_ids):
+        location_assets = index.get(location_id)
+        if not location_assets:
+            continue
+        if flags is not None:
+            location_assets = [asset for asset in location_assets if asset.get('location_flag') in flags]
+            if not location_assets:
+                continue
+        grouped[location_id] = location_assets
+    return grouped
+
+
+class AssetSnapshot:
+    def __init__(self, corporation_id, assets, fetched_at, observed_at=None):
+        self.corporation_id = corporation_id
+        self.assets = assets
+        self.fetched_at = fetched_at
+        # When ESI generated the data (Last-Modified), can be up to an hour before fetched_at
+        self.observed_at = fetched_at if observed_at is None else observed_at
+        self._by_location = None
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+    @property
+    def by_location(self):
+        # Built once per snapshot and shared by every consumer that reads it
+        if self._by_location is None:
+            self._by_location = index_assets_by_location(self.assets)
+        return self._by_location
+
+    def group(self, location_ids=None, flags=None):
+        return group_assets_by_location(self.by_location, location_ids, flags)
+
+
+class AssetSnapshotStore:
+    """Latest /corporations/{id}/assets/ result per guild and corporation.
+
+    Gas checks, goo checks, the alert scheduler and the Mongo ingestion all
+    read from here, so a corporation's assets are downloaded at most once per
+    max_age window. Concurrent callers for the same guild and corporation
+    share a single in-flight fetch. Snapshots are fetched with a guild's own
+    token and filtered by its own drills, so they are never served to
+    another guild, and a guild without a valid token gets no snapshot at all.
+    """
+
+    def __init__(self, max_age=600, streaming=True):
+        self.max_age = max_age
+        self.streaming = streaming
+        self._snapshots = {}
+        self._in_flight = {}
+
+    async def get(self, server_id, corporation_id, max_age=None):
+        """Return a fresh AssetSnapshot, fetching it if the stored one is too old.
+
+        Raises aiohttp.ClientError / asyncio.TimeoutError if ESI fails and
+        ValueError if no valid access token is available.
+        """
+        key = (str(server_id), str(corporation_id))
+        max_age = self.max_age if max_age is None else max_age
+
+        # Checked on every call, also when the snapshot is cached, so a revoked token stops access right away
+        access_token = get_access_token(server_id, corporation_id)
+        if not access_token:
+            raise ValueError('Failed to get access token')
+
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and snapshot.age() < max_age:
+            return snapshot
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, access_token))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shield so one cancelled caller does not cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key, access_token):
+        server_id, corporation_id = key
+        headers = {'Authorization': f'Bearer {access_token}'}
+        url = f'https://esi.evetech.net/latest/corporations/{corporation_id}/assets/'
+        params = {'datasource': 'tranquility'}
+
+        if self.streaming:
+            # Parse pages incrementally and keep only drill contents, so memory stays
+            # bounded by what the bot actually uses instead of the corp's whole hangar
+            drill_ids = load_server_structures(server_id, corporation_id).get('metenox_moon_drill_ids', [])
+            assets, observed_at = await esi_client.get_all_pages(url, headers=headers, params=params,
+                                                                 row_filter=make_drill_asset_filter(drill_ids), filter_key='drill_assets',
+                                                                 with_last_modified=True)
+        else:
+            assets, observed_at = await esi_client.get_all_pages(url, headers=headers, params=params, with_last_modified=True)
+
+        snapshot = AssetSnapshot(corporation_id, assets, time.time(), observed_at)
+        self._snapshots[key] = snapshot
+        logging.info(f"Asset snapshot for server {server_id}, corporation {corporation_id} refreshed ({len(assets)} assets).")
+        return snapshot
+
+    def latest(self, server_id, corporation_id):
+        """Return the stored snapshot of a guild's corporation without fetching, or None."""
+        return self._snapshots.get((str(server_id), str(corporation_id)))
+
+    def invalidate(self, server_id, corporation_id):
+        """Drop the stored snapshot, e.g. when the drill list it was filtered by changed."""
+        self._snapshots.pop((str(server_id), str(corporation_id)), None)
+
+
+asset_snapshots = AssetSnapshotStore(
+    max_age=get_config('asset_snapshot_max_age', 600),
+    streaming=get_config('asset_streaming', True)
+)
@@ -0,0 +1,91 @@
+"""Benchmark for forecast.DrillLevels against the old per-structure threshold loop.
+
+Run from the repository root:
+
+    python benchmarks/bench_alert_evaluation.py
+
+Evaluates synthetic gas/fuel levels spread over guilds of 20 drills (every
+tenth guild with its own thresholds) and prints the build/evaluate timings
+next to a loop that computes the remaining time per drill and resource like
+calculate_depletion_time did before.
+
+The alert scheduler evaluates one corporation at a time, i.e. a handful to a
+few dozen drills. At those sizes the array setup (tens of microseconds)
+dominates and the plain loop is faster; both are negligible next to the
+asset download of the same check. The larger counts show the cost of
+evaluating many corporations at once.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from forecast import ALERT_THRESHOLDS, DrillLevels, FUEL_PER_HOUR, GAS_PER_HOUR
+
+DRILL_COUNTS = [5, 20, 80, 1000, 10000, 100000]
+DRILLS_PER_GUILD = 20
+CUSTOM_THRESHOLDS = (72.0, 48.0, 12.0)
+
+
+def make_rows(drill_count, now, seed=1):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(drill_count):
+        guild = i // DRILLS_PER_GUILD
+        thresholds = CUSTOM_THRESHOLDS if guild % 10 == 0 else tuple(float(hours) for hours in ALERT_THRESHOLDS)
+        gas = rng.randint(0, 150 * 24 * 14)
+        fuel = rng.randint(0, 5 * 24 * 30)
+        rows.append((str(guild), '1', i, f"Drill {i}", gas, fuel, now - rng.uniform(0, 3600), thresholds))
+    return rows
+
+
+def build_levels(rows):
+    levels = DrillLevels()
+    for row in rows:
+        levels.add(*row)
+    return levels
+
+
+def loop_evaluation(rows, now):
+    # The previous approach: remaining time and threshold checks per drill and resource
+    alerts = []
+    for _, _, structure_id, _, gas, fuel, observed_at, thresholds in rows:
+        for resource, amount, rate in (('magmatic_gas', gas, GAS_PER_HOUR), ('fuel_blocks', fuel, FUEL_PER_HOUR)):
+            remaining = max(0.0, observed_at + amount / rate * 3600 - now) / 3600
+            crossed = [hours for hours in thresholds if remaining < hours]
+            if crossed:
+                alerts.append((structure_id, resource, min(crossed)))
+    return alerts
+
+
+def best_of(func, *args, repeat=5):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    now = time.time()
+    print(f"{'drills':>8} {'build (us)':>11} {'evaluate (us)':>14} {'loop (us)':>10} {'alerts':>7}")
+    for drill_count in DRILL_COUNTS:
+        rows = make_rows(drill_count, now)
+
+        build_time, levels = best_of(build_levels, rows)
+        evaluate_time, evaluation = best_of(levels.evaluate, now)
+        loop_time, expected = best_of(loop_evaluation, rows, now)
+
+        # Both approaches must report the same alerts
+        alerts = [(levels.structure_ids[row], resource, level) for row, resource, level, _, _ in evaluation.alerts()]
+        assert sorted(alerts) == sorted(expected)
+
+        print(f"{drill_count:>8} {build_time * 1e6:>11.1f} {evaluate_time * 1e6:>14.1f} {loop_time * 1e6:>10.1f} {len(alerts):>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Micro-benchmark for assets.index_assets_by_location / group_assets_by_location.
+
+Run from the repository root:
+
+    python benchmarks/bench_asset_grouping.py
+
+Groups synthetic corporation asset lists (up to 100k assets, 500 drills) and
+checks that the cost per asset stays flat, i.e. grouping is linear in the
+number of assets and does not grow with the number of drills.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets import index_assets_by_location, group_assets_by_location
+
+DRILL_COUNT = 500
+ASSET_COUNTS = [10_000, 50_000, 100_000]
+FLAGS = ['StructureFuel', 'MoonMaterialBay', 'Hangar', 'CorpSAG1', 'CorpDeliveries']
+
+
+def make_assets(asset_count, drill_ids, seed=1):
+    rng = random.Random(seed)
+    other_locations = [70_000_000 + i for i in range(2_000)]
+    assets = []
+    for item_id in range(asset_count):
+        in_drill = rng.random() < 0.2
+        assets.append({
+            'item_id': item_id,
+            'location_id': rng.choice(drill_ids) if in_drill else rng.choice(other_locations),
+            'location_flag': rng.choice(FLAGS[:2]) if in_drill else rng.choice(FLAGS[2:]),
+            'type_id': rng.choice([81143, 4312, 16634, 16643]),
+            'quantity': rng.randint(1, 50_000),
+        })
+    return assets
+
+
+def group(assets, drill_ids):
+    index = index_assets_by_location(assets)
+    return group_assets_by_location(index, drill_ids, flags={'StructureFuel'})
+
+
+def legacy_group(assets, drill_ids):
+    # The old scheduler approach: one full scan of the asset list per drill
+    grouped = {}
+    for structure_id in drill_ids:
+        location_assets = [a for a in assets if a.get('location_id') == structure_id and a.get('location_flag') == 'StructureFuel']
+        if location_assets:
+            grouped[structure_id] = location_assets
+    return grouped
+
+
+def best_of(func, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    drill_ids = [1_035_000_000_000 + i for i in range(DRILL_COUNT)]
+
+    per_asset = []
+    print(f"{'assets':>8} {'drills':>7} {'grouped (ms)':>13} {'ns/asset':>9}")
+    for asset_count in ASSET_COUNTS:
+        assets = make_assets(asset_count, drill_ids)
+        elapsed = best_of(group, assets, drill_ids)
+        per_asset.append(elapsed / asset_count)
+        print(f"{asset_count:>8} {DRILL_COUNT:>7} {elapsed * 1000:>13.2f} {elapsed / asset_count * 1e9:>9.1f}")
+
+    # Sanity check against the legacy implementation on a smaller input
+    assets = make_assets(10_000, drill_ids)
+    assert group(assets, drill_ids) == legacy_group(assets, drill_ids)
+    legacy = best_of(legacy_group, assets, drill_ids, repeat=1)
+    print(f"legacy per-drill scan at 10000 assets: {legacy * 1000:.2f} ms")
+
+    # Linear scaling: cost per asset at 100k must stay within 3x of the cost at 10k
+    ratio = per_asset[-1] / per_asset[0]
+    print(f"ns/asset ratio 100k vs 10k: {ratio:.2f}")
+    if ratio > 3:
+        sys.exit("Asset grouping does not scale linearly")
+
+
+if __name__ == '__main__':
+    main()
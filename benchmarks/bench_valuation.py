@@ -0,0 +1,86 @@
+"""Benchmark for valuation.GooValuation against the old per-item loop.
+
+Run from the repository root:
+
+    python benchmarks/bench_valuation.py
+
+Values synthetic goo holdings for 100, 1000 and 5000 structures (every
+structure holding all 20 goo types) and prints build/value timings next to
+the nested-loop valuation that the report commands used before.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from market_calculation import PriceTable
+from moongoo import get_moon_goo_items
+from valuation import GooValuation
+
+STRUCTURE_COUNTS = [100, 1000, 5000]
+CORPORATION_COUNT = 25
+
+
+def make_holdings(structure_count, seed=1):
+    rng = random.Random(seed)
+    names = list(get_moon_goo_items().values())
+    return {
+        f"Corp {i % CORPORATION_COUNT} - Drill {i}": {name: rng.randint(0, 500_000) for name in names}
+        for i in range(structure_count)
+    }
+
+
+def make_price_table(seed=1):
+    rng = random.Random(seed)
+    return PriceTable({
+        type_id: {'buyAvgFivePercent': rng.uniform(100, 50_000), 'sellAvgFivePercent': rng.uniform(100, 60_000)}
+        for type_id in get_moon_goo_items()
+    })
+
+
+def loop_valuation(holdings, price_table):
+    # The previous approach: nested Python loops with a dict lookup per item
+    structure_totals = {}
+    for station_name, items in holdings.items():
+        total_buy = total_sell = 0
+        for item_name, amount in items.items():
+            buy_price, sell_price = price_table.prices(item_name)
+            total_buy += buy_price * amount
+            total_sell += sell_price * amount
+        structure_totals[station_name] = (total_buy, total_sell)
+    return structure_totals
+
+
+def best_of(func, *args, repeat=5):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    price_table = make_price_table()
+    print(f"{'structures':>10} {'build (ms)':>11} {'value (ms)':>11} {'loop (ms)':>10}")
+    for structure_count in STRUCTURE_COUNTS:
+        holdings = make_holdings(structure_count)
+
+        build_time, valuation = best_of(GooValuation, holdings)
+        value_time, valuation = best_of(valuation.value, price_table)
+        loop_time, expected = best_of(loop_valuation, holdings, price_table)
+
+        # Both approaches must agree on every structure total
+        for row, station_name in enumerate(valuation.structures):
+            expected_buy, expected_sell = expected[station_name]
+            assert abs(valuation.structure_buy[row] - expected_buy) <= 1e-6 * max(1, expected_buy)
+            assert abs(valuation.structure_sell[row] - expected_sell) <= 1e-6 * max(1, expected_sell)
+
+        print(f"{structure_count:>10} {build_time * 1000:>11.2f} {value_time * 1000:>11.3f} {loop_time * 1000:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import discord
 import logging
+import signal
 import threading
 import base64
 import requests
@@ -10,13 +11,15 @@ from flask import Flask, request, render_template
 from discord.ext import commands
 from discord.ui import Select, View
 from discord.utils import get
-from scheduler import run_alert_scheduler
+from scheduler import alert_scheduler
 import config
 import tasks
 from moongoo_commands import load_moon_goo_from_json
 from datetime import datetime
 from flask import Flask, send_from_directory
 from administration import get_character_info, get_corporation_id
+from esi import esi_client
+from bot_statistics import get_metrics, get_moon_drill_count
 from commands import (
     handle_mongo_pricing, handle_setup, handle_authenticate, handle_update_moondrills, handle_checkgas, handle_spacegoblin, handle_showadmin, handle_help, handle_fetch_moon_goo_assets, handle_structure_pricing
 )
@@ -30,8 +33,25 @@ CLIENT_SECRET = config.get_config('eve_online_secret_key')
 intents = discord.Intents.default()
 intents.message_content = True  # Enable the message content intent
 
+class MoonGooBot(commands.Bot):
+    async def setup_hook(self):
+        # docker stop sends SIGTERM. Handled on the loop rather than with signal.signal, whose handler
+        # runs in the middle of whatever the main thread is doing, e.g. a save holding the storage lock
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.handle_sigterm)
+
+    def handle_sigterm(self):
+        logging.info("SIGTERM received, flushing pending saves and shutting down.")
+        self.shutdown_task = asyncio.create_task(self.close())
+
+    async def close(self):
+        await super().close()
+        # Runs on Ctrl+C and SIGTERM alike, closing the pool avoids the "Unclosed client session" warning
+        await esi_client.close()
+        # Pending saves would otherwise only be written by atexit, off the loop like every other storage write
+        await asyncio.to_thread(config.storage.flush)
+
 # Initialize the bot with the defined intents
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = MoonGooBot(command_prefix='!', intents=intents)
 
 app = Flask(__name__)
 
@@ -40,6 +60,18 @@ bot_start_time = datetime.utcnow()
 def run_flask():
     app.run(host='127.0.0.1', port=5005, ssl_context=None)
 
+def run_on_bot_loop(coro, timeout=30):
+    """Run a coroutine on the bot's event loop from the Flask thread and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, bot.loop).result(timeout)
+
+def enable_loop_debugging():
+    """Log every callback that blocks the event loop longer than slow_callback_threshold seconds."""
+    loop = asyncio.get_running_loop()
+    loop.set_debug(True)
+    loop.slow_callback_duration = config.get_config('slow_callback_threshold', 0.1)
+    logging.getLogger('asyncio').setLevel(logging.WARNING)
+    logging.info(f"Event loop debug mode enabled (slow callback threshold: {loop.slow_callback_duration}s).")
+
 # Load tokens and server IDs from file
 tokens = config.load_all_tokens()
 server_ids = config.get_all_server_ids()
@@ -51,6 +83,10 @@ logging.basicConfig(level=logging.DEBUG)
 async def on_ready():
     print(f'Logged in as {bot.user.name} ({bot.user.id})')
     print('------')
+    # Open the shared ESI connection pool before any task starts using it
+    await esi_client.start()
+    if config.get_config('debug_event_loop', False):
+        enable_loop_debugging()
     tasks.start_tasks(bot)
 
 @bot.event
@@ -76,9 +112,8 @@ async def on_interaction(interaction: discord.Interaction):
 
             await interaction.response.send_message(f"Alert channel set to <#{selected_channel_id}>")
 
-            # Start alert scheduler if not already running
-            if not any(task.get_name() == f"alert_scheduler_{server_id}" for task in asyncio.all_tasks()):
-                asyncio.create_task(run_alert_scheduler(bot, server_id), name=f"alert_scheduler_{server_id}")
+            # Check this server's drills right away with the new channel
+            alert_scheduler.schedule_server(server_id)
 
         elif custom_id == 'select_structure':
             # Handle structure selection
@@ -136,8 +171,7 @@ async def selectalertchannel(ctx):
 
         await interaction.response.send_message(f"Alert channel set to <#{selected_channel_id}>", ephemeral=True)
 
-        if not any(task.get_name() == f"alert_scheduler_{server_id}" for task in asyncio.all_tasks()):
-            asyncio.create_task(run_alert_scheduler(bot, server_id), name=f"alert_scheduler_{server_id}")
+        alert_scheduler.schedule_server(server_id)
 
     select.callback = select_callback
     view.add_item(select)
@@ -277,7 +311,7 @@ def oauth_callback():
     refresh_token = response_data.get('refresh_token', None)
     expires_in = response_data.get('expires_in', None)
 
-    character_info = get_character_info(access_token)
+    character_info = run_on_bot_loop(get_character_info(access_token))
     if not character_info:
         return "Failed to retrieve character info", 500
 
@@ -285,7 +319,7 @@ def oauth_callback():
     if not character_id:
         return "Character ID not found in the character info", 500
 
-    corporation_id = get_corporation_id(character_id, access_token)
+    corporation_id = run_on_bot_loop(get_corporation_id(character_id, access_token))
     if corporation_id is None:
         return "Failed to retrieve corporation ID", 500
 
@@ -303,6 +337,19 @@ def tos():
 def about():
     return render_template('about.html')
 
+@app.route('/bot-stats')
+def bot_stats():
+    current_time = datetime.utcnow()
+    stats = {
+        'current_time': current_time,
+        'uptime': str(current_time - bot_start_time).split('.')[0],
+        'version': bot_version,
+        'server_count': len(config.get_all_server_ids()),
+        'moon_drill_count': get_moon_drill_count(),
+        'metrics': sorted(get_metrics().items())
+    }
+    return render_template('bot_stats.html', stats=stats)
+
 @app.route('/privacy-policy')
 def privacy():
     return render_template('policy.html')
@@ -317,7 +364,7 @@ if __name__ == "__main__":
         server_ids = config.get_all_server_ids()
         print("Server IDs:", server_ids)
 
-        flask_thread = threading.Thread(target=run_flask)
+        flask_thread = threading.Thread(target=run_flask, daemon=True)
         flask_thread.start()
 
         bot.run(config.get_config('discord_bot_token', ''))
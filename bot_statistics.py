@@ -1,20 +1,33 @@
-import json
+import threading
+from registry import registry
+import config
 from datetime import datetime, timedelta
 
-def load_json(file_path):
-    try:
-        with open(file_path, 'r') as file:
-            return json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Error loading {file_path}: {e}")
-        return {}
+# Process-wide counters/gauges/timings, read by the /bot-stats page
+_metrics = {}
+_metrics_lock = threading.Lock()
 
-#server_structures = load_json('server_structures.json')
-#metenox_goo = load_json('metenox_goo.json')
+def increment_metric(name, value=1):
+    with _metrics_lock:
+        _metrics[name] = _metrics.get(name, 0) + value
 
-#
-#def get_moon_drill_count():
-#    moon_drill_count = 0
-#    for server_id, data in server_structures.items():
-#        moon_drill_count += len(data.get("metenox_moon_drill_ids", []))
-#    return moon_drill_count
+def set_metric(name, value):
+    with _metrics_lock:
+        _metrics[name] = value
+
+def record_timing(name, seconds):
+    """Record the duration of one run as <name>_last_seconds plus a run counter."""
+    with _metrics_lock:
+        _metrics[f"{name}_last_seconds"] = round(seconds, 3)
+        _metrics[f"{name}_runs"] = _metrics.get(f"{name}_runs", 0) + 1
+
+def get_metrics():
+    with _metrics_lock:
+        return dict(_metrics)
+
+def get_moon_drill_count():
+    moon_drill_count = 0
+    for server_id, corporation_id in registry.structure_targets():
+        data = config.load_server_structures(server_id, corporation_id)
+        moon_drill_count += len(data.get("metenox_moon_drill_ids", []))
+    return moon_drill_count
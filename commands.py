@@ -3,18 +3,17 @@ import yaml
 import json
 import uuid
 import config
-import moongoo
 import pandas as pd
-import os
 import discord
 from moongoo_commands import handle_fetch_moon_goo_assets
 from config import save_server_structures, load_server_structures
 from datetime import datetime, timedelta
 from administration import extract_corporation_id_from_filename
-from moongoo import get_moon_goo_items
+from assets import asset_snapshots
+from valuation import GooValuation
 from structurecommands import get_all_structure_assets, get_moon_drills, update_structure_info
 from moongoo_commands import load_moon_goo_from_json
-from market_calculation import format_number, load_market_stats, send_message_in_chunks
+from market_calculation import format_number, ensure_fresh_prices, get_server_price_hub, send_message_in_chunks
 
 logging.basicConfig(level=logging.INFO)
 
@@ -119,6 +118,10 @@ async def handle_update_moondrills(ctx):
 
     # Fetch the new moon drill IDs
     moon_drill_ids = await get_moon_drills(server_id)
+    if moon_drill_ids is None:
+        # Keep the saved drills, an ESI error must not look like a corporation without drills
+        await ctx.send("Failed to fetch the moon drills from ESI, your saved drills were kept. Please try again later.")
+        return
 
     # Determine the corporation_id dynamically
     corporation_id = extract_corporation_id_from_filename(server_id)
@@ -127,14 +130,6 @@ async def handle_update_moondrills(ctx):
         return
 
 
-    # Backup and delete existing file if it exists
-    filename = f"{server_id}_{corporation_id}_structures.json"
-    if os.path.exists(filename):
-        os.remove(filename)
-        logging.info(f"Deleted existing file {filename} before saving the updated structures.")
-
-
-
     # Load existing server structures for the specific server and corporation
     server_structures = load_server_structures(server_id, corporation_id)
 
@@ -155,7 +150,7 @@ async def handle_update_moondrills(ctx):
 
     # Fetch and update structure information
     try:
-        await update_structure_info(server_id, moon_drill_ids)
+        await update_structure_info(server_id, moon_drill_ids, refresh=True)
     except Exception as e:
         logging.error(f"Error updating structure info: {e}")
         await ctx.send("Failed to update structure information. Please try again later.")
@@ -185,6 +180,9 @@ async def handle_update_moondrills(ctx):
     except ValueError as ve:
         logging.error(f"Error in save_server_structures: {ve}")
         await ctx.send("Failed to save server structures. Please try again later.")
+
+    # The stored asset snapshot only holds the contents of the old drill list
+    asset_snapshots.invalidate(server_id, corporation_id)
         
     # If no moon drill IDs were found, update the server structures accordingly
     if not moon_drill_ids:
@@ -318,49 +316,38 @@ async def handle_mongo_pricing(ctx):
         moon_goo_data = await load_moon_goo_from_json(server_id)
         logging.debug(f"Loaded moon goo data for server {server_id}: {moon_goo_data}")
 
-        # Load market stats data
-        market_stats = load_market_stats()
-        logging.debug(f"Loaded market stats: {market_stats}")
-
-        # Fetch the MOON_GOO_ITEMS mapping
-        moon_goo_items = moongoo.get_moon_goo_items()
+        # Value every structure, corporation and the whole guild in one vectorized pass
+        price_table = await ensure_fresh_prices()
+        valuation = GooValuation(moon_goo_data).value(price_table.for_hub(get_server_price_hub(server_id)))
 
         # Initialize output string
         output = []
 
         # Loop through stations and items in moon goo data
-        for station_name, items in moon_goo_data.items():
+        for row, (station_name, items) in enumerate(moon_goo_data.items()):
             # Add station name in bold
             output.append(f"**{station_name}:**")
             for item_name, amount in items.items():
-                try:
-                    # Fetch the item ID from the `MOON_GOO_ITEMS` mapping
-                    item_id = None
-                    for key, value in moon_goo_items.items():
-                        if value == item_name:
-                            item_id = key
-                            break
-                    
-                    if item_id is None:
-                        logging.warning(f"Item '{item_name}' not found in MOON_GOO_ITEMS mapping.")
-                        continue
-
-                    # Get market stats for the item
-                    item_stats = market_stats.get(str(item_id), {})
-                    buy_price = item_stats.get('buyAvgFivePercent', 0)
-                    sell_price = item_stats.get('sellAvgFivePercent', 0)
-
-                    total_buy_price = buy_price * amount
-                    total_sell_price = sell_price * amount
-
-                    # Append formatted data to output
-                    formatted_buy_price = format_number(total_buy_price)
-                    formatted_sell_price = format_number(total_sell_price)
-                    
-                    output.append(f"> **{amount}** - {item_name} -> **Buy**: {formatted_buy_price} **Sell**: {formatted_sell_price}")
-
-                except Exception as item_error:
-                    logging.error(f"Error processing item {item_name} in station {station_name}: {str(item_error)}")
+                if item_name in valuation.unknown_items:
+                    logging.warning(f"Item '{item_name}' not found in MOON_GOO_ITEMS mapping.")
+                    continue
+
+                total_buy_price, total_sell_price = valuation.item_values(row, item_name)
+
+                # Append formatted data to output
+                formatted_buy_price = format_number(total_buy_price)
+                formatted_sell_price = format_number(total_sell_price)
+                
+                output.append(f"> **{amount}** - {item_name} -> **Buy**: {formatted_buy_price} **Sell**: {formatted_sell_price}")
+
+            output.append(f"> __Total__ -> **Buy**: {format_number(valuation.structure_buy[row])} **Sell**: {format_number(valuation.structure_sell[row])}")
+
+        # Summary per corporation and for the whole server
+        if moon_goo_data:
+            output.append("")
+            for corporation, (corp_buy, corp_sell) in valuation.corporation_totals().items():
+                output.append(f"**{corporation}** -> **Buy**: {format_number(corp_buy)} **Sell**: {format_number(corp_sell)}")
+            output.append(f"**All structures** -> **Buy**: {format_number(valuation.guild_buy)} **Sell**: {format_number(valuation.guild_sell)}")
 
         # Convert the output list to a single string
         output_message = "\n".join(output)
@@ -398,49 +385,30 @@ async def handle_structure_pricing(interaction: discord.Interaction, structure_n
         moon_goo_data = await load_moon_goo_from_json(server_id)
         logging.debug(f"Loaded moon goo data for server {server_id}: {moon_goo_data}")
 
-        # Load market stats data
-        market_stats = load_market_stats()
-        logging.debug(f"Loaded market stats: {market_stats}")
-
-        # Fetch the MOON_GOO_ITEMS mapping
-        moon_goo_items = get_moon_goo_items()
-
         # Initialize output string
         output = []
 
         # Process the data only for the selected structure
         if structure_name in moon_goo_data:
             items = moon_goo_data[structure_name]
+            # Interactions must be answered within 3 seconds, so do not wait for a running refresh
+            price_table = await ensure_fresh_prices(wait=False)
+            valuation = GooValuation({structure_name: items}).value(price_table.for_hub(get_server_price_hub(server_id)))
             output.append(f"**{structure_name}:**")
             for item_name, amount in items.items():
-                try:
-                    # Fetch the item ID from the `MOON_GOO_ITEMS` mapping
-                    item_id = None
-                    for key, value in moon_goo_items.items():
-                        if value == item_name:
-                            item_id = key
-                            break
-
-                    if item_id is None:
-                        logging.warning(f"Item '{item_name}' not found in MOON_GOO_ITEMS mapping.")
-                        continue
-
-                    # Get market stats for the item
-                    item_stats = market_stats.get(str(item_id), {})
-                    buy_price = item_stats.get('buyAvgFivePercent', 0)
-                    sell_price = item_stats.get('sellAvgFivePercent', 0)
-
-                    total_buy_price = buy_price * amount
-                    total_sell_price = sell_price * amount
-
-                    # Append formatted data to output
-                    formatted_buy_price = format_number(total_buy_price)
-                    formatted_sell_price = format_number(total_sell_price)
-
-                    output.append(f"**{item_name}**: {amount} --- **Buy**: {formatted_buy_price} --- **Sell**: {formatted_sell_price}")
-
-                except Exception as item_error:
-                    logging.error(f"Error processing item {item_name} in structure {structure_name}: {str(item_error)}")
+                if item_name in valuation.unknown_items:
+                    logging.warning(f"Item '{item_name}' not found in MOON_GOO_ITEMS mapping.")
+                    continue
+
+                total_buy_price, total_sell_price = valuation.item_values(0, item_name)
+
+                # Append formatted data to output
+                formatted_buy_price = format_number(total_buy_price)
+                formatted_sell_price = format_number(total_sell_price)
+
+                output.append(f"**{item_name}**: {amount} --- **Buy**: {formatted_buy_price} --- **Sell**: {formatted_sell_price}")
+
+            output.append(f"**Total** --- **Buy**: {format_number(valuation.guild_buy)} --- **Sell**: {format_number(valuation.guild_sell)}")
 
         # Convert the output list to a single string
         output_message = "\n".join(output)
@@ -3,6 +3,9 @@ import json
 import os
 from datetime import datetime
 import logging
+import time
+from registry import registry
+from storage import create_storage, write_atomic
 
 # Define global variables to be loaded from the config.yaml
 config = {}
@@ -12,13 +15,23 @@ config_file = 'config.yaml'
 tokens_file = 'tokens.json'
 alert_channel_file = 'alert_channels.json'
 USE_MONGODB = True
+storage = None  # Tokens, structures, goo holdings and alert channels, see storage.py
+config_mtime = None  # st_mtime_ns of config.yaml when it was last loaded
+config_checked_at = 0.0
+server_settings = {}  # key -> {server_id: value} of server_* settings, rebuilt after each reload
+alert_channels_cache = None  # server_id -> channel_id, filled on first use and updated by save_alert_channels
 
 def load_config():
-    global config
+    global config, config_mtime, server_settings
     try:
+        # Taken before reading, so an edit made while reading triggers another reload
+        config_mtime = os.stat(config_file).st_mtime_ns
         with open(config_file, 'r') as file:
             config = yaml.safe_load(file) or {}
+        server_settings = {}
     except FileNotFoundError:
+        config_mtime = None
+        server_settings = {}
         config = {
             'admin_channels': [],
             'alert_channel_id': None,
@@ -30,31 +43,60 @@ def load_config():
             'admin_role': 'Admin',
         }
 
-def save_config(config_data):
-    global config
+def save_config(config_data=None):
+    global config, config_mtime, server_settings
+    if config_data is None:
+        config_data = config
     try:
-        with open(config_file, 'w') as file:
-            yaml.safe_dump(config_data, file)
-    except IOError as e:
+        write_atomic(config_file, yaml.safe_dump(config_data))
+        config, server_settings = config_data, {}
+        # Our own write is not an external edit
+        config_mtime = os.stat(config_file).st_mtime_ns
+    except (IOError, OSError) as e:
         logging.error(f"Error saving configuration: {e}")
 
-def load_token(server_id, corporation_id):
-    """Load the token for a specific server and corporation from a file."""
-    filename = f"{server_id}_{corporation_id}_token.json"
+def reload_config_if_changed(force=False):
+    """Reload config.yaml if it was edited since it was loaded.
 
-    if not os.path.exists(filename):
-        logging.error(f"No token file found for server {server_id} and corporation {corporation_id}.")
-        return {}
+    The file is stat()ed at most every config_reload_interval seconds (5 by
+    default), so get_config stays a dict read between checks. If the edited
+    file does not parse, the previous configuration is kept.
+    """
+    global config_checked_at
+    now = time.monotonic()
+    if not force and now - config_checked_at < config.get('config_reload_interval', 5):
+        return False
+    config_checked_at = now
+
+    try:
+        mtime = os.stat(config_file).st_mtime_ns
+    except OSError:
+        return False
+    if mtime == config_mtime:
+        return False
 
     try:
-        with open(filename, 'r') as file:
-            token_data = json.load(file)
-        logging.debug(f"Token for server {server_id} and corporation {corporation_id} loaded from {filename}.")
-        return token_data
+        load_config()
+    except (IOError, yaml.YAMLError) as e:
+        logging.error(f"Error reloading {config_file}, keeping the previous configuration: {e}")
+        return False
+    logging.info(f"Reloaded {config_file}.")
+    return True
+
+def load_token(server_id, corporation_id):
+    """Load the token for a specific server and corporation from the storage backend."""
+    try:
+        token_data = storage.load_token(server_id, corporation_id)
     except Exception as e:
-        logging.error(f"Error loading token from file {filename}: {str(e)}")
+        logging.error(f"Error loading token for server {server_id} and corporation {corporation_id}: {str(e)}")
         return {}
 
+    if token_data is None:
+        logging.error(f"No token found for server {server_id} and corporation {corporation_id}.")
+        return {}
+    logging.debug(f"Token for server {server_id} and corporation {corporation_id} loaded.")
+    return token_data
+
 def initialize_tokens_file():
     if not os.path.exists(tokens_file) or os.path.getsize(tokens_file) == 0:
         with open(tokens_file, 'w') as file:
@@ -62,9 +104,7 @@ def initialize_tokens_file():
         logging.debug("Initialized empty tokens.json file.")
 
 def save_token(server_id, corporation_id, access_token, refresh_token, expires_in, created_at, character_id):
-    """Save the token for a specific server and corporation to a file."""
-    filename = f"{server_id}_{corporation_id}_token.json"
-
+    """Save the token for a specific server and corporation to the storage backend."""
     token_data = {
         "access_token": access_token,
         "refresh_token": refresh_token,
@@ -74,21 +114,19 @@ def save_token(server_id, corporation_id, access_token, refresh_token, expires_i
     }
 
     try:
-        with open(filename, 'w') as file:
-            json.dump(token_data, file, indent=4)
-        logging.debug(f"Token for server {server_id} and corporation {corporation_id} saved to {filename}.")
+        storage.save_token(server_id, corporation_id, token_data)
+        registry.add('token', server_id, corporation_id)
+        logging.debug(f"Token for server {server_id} and corporation {corporation_id} saved.")
     except Exception as e:
-        logging.error(f"Error saving token to file {filename}: {str(e)}")
+        logging.error(f"Error saving token for server {server_id} and corporation {corporation_id}: {str(e)}")
 
 def get_server_tokens(server_id):
     """Get all tokens for a specific server."""
     server_tokens = {}
-    for filename in os.listdir():
-        if filename.startswith(f"{server_id}_") and filename.endswith("_token.json"):
-            corporation_id = filename.split('_')[1]
-            token_data = load_token(server_id, corporation_id)
-            if token_data:
-                server_tokens[corporation_id] = token_data
+    for corporation_id in registry.token_corporations(server_id):
+        token_data = load_token(server_id, corporation_id)
+        if token_data:
+            server_tokens[corporation_id] = token_data
     return server_tokens
 
 def add_server_id(server_id):
@@ -116,8 +154,18 @@ def update_tokens(server_id):
         json.dump(tokens, file, indent=4)
 
 def get_config(key, default=None):
+    reload_config_if_changed()
     return config.get(key, default)
 
+def get_server_config(key, server_id, default=None):
+    """Per server value of a mapping setting such as server_price_hubs ({server_id: value})."""
+    reload_config_if_changed()
+    settings = server_settings.get(key)
+    if settings is None:
+        # YAML reads unquoted server IDs as ints, index them as strings once per reload
+        settings = server_settings[key] = {str(sid): value for sid, value in (config.get(key) or {}).items()}
+    return settings.get(str(server_id), default)
+
 def set_config(key, value, server_id=None):
     global config
 
@@ -134,36 +182,33 @@ def set_config(key, value, server_id=None):
 
     save_config(config)
 
+def cached_alert_channels():
+    global alert_channels_cache
+    if alert_channels_cache is None:
+        try:
+            alert_channels_cache = storage.load_alert_channels()
+        except Exception as e:
+            # Log the error and try again on the next lookup
+            logging.error(f"Error loading alert channels: {e}")
+            return {}
+    return alert_channels_cache
+
 def load_alert_channels():
-    """Load alert channels from a JSON file."""
-    if not os.path.exists(alert_channel_file):
-        # If file doesn't exist, return an empty dictionary
-        return {}
-    
-    try:
-        with open(alert_channel_file, 'r') as file:
-            data = file.read().strip()  # Read and strip any extra whitespace
-            if not data:
-                # If file is empty, return an empty dictionary
-                return {}
-            return json.loads(data)
-    except (IOError, json.JSONDecodeError) as e:
-        # Log the error and return an empty dictionary
-        logging.error(f"Error loading alert channels: {e}")
-        return {}
+    """Alert channels (server_id -> channel_id), a copy callers may change and pass to save_alert_channels."""
+    return dict(cached_alert_channels())
 
 def save_alert_channels(alert_channels):
-    """Save alert channels to a JSON file."""
+    """Save alert channels to the storage backend and the in-memory cache."""
+    global alert_channels_cache
+    alert_channels_cache = dict(alert_channels)
     try:
-        with open(alert_channel_file, 'w') as file:
-            json.dump(alert_channels, file, indent=4)
-    except IOError as e:
+        storage.save_alert_channels(alert_channels)
+    except Exception as e:
         logging.error(f"Error saving alert channels: {e}")
 
 # Function to get the alert channel ID for a specific server
 def get_alert_channel(server_id):
-    alert_channels = load_alert_channels()
-    return alert_channels.get(str(server_id))
+    return cached_alert_channels().get(str(server_id))
 
 # Example function to send a message to the alert channel of a specific server
 async def send_alert_message(bot, server_id, message):
@@ -178,31 +223,35 @@ async def send_alert_message(bot, server_id, message):
         print(f"No alert channel set for server ID {server_id}.")
 
 def save_server_structures(server_structures, server_id, corporation_id):
-    """Save the server structures for a specific server and corporation to the JSON file."""
-    filename = f"{server_id}_{corporation_id}_structures.json"
+    """Save the server structures for a specific server and corporation to the storage backend."""
     try:
-        # Open the file in write mode, which will truncate the file to zero length
-        with open(filename, 'w') as file:
-            json.dump(server_structures, file, indent=4)
-        logging.debug(f"Structures for server {server_id} and corporation {corporation_id} saved to {filename}.")
-    except IOError as e:
-        logging.error(f"Error saving structures to file {filename}: {e}")
+        storage.save_structures(server_id, corporation_id, server_structures)
+        registry.add('structures', server_id, corporation_id)
+        logging.debug(f"Structures for server {server_id} and corporation {corporation_id} saved.")
+    except Exception as e:
+        logging.error(f"Error saving structures for server {server_id} and corporation {corporation_id}: {e}")
         raise
 
 def load_server_structures(server_id, corporation_id):
-    """Load the server structures for a specific server and corporation from the JSON file."""
-    filename = f"{server_id}_{corporation_id}_structures.json"
+    """Load the server structures for a specific server and corporation from the storage backend."""
     try:
-        with open(filename, 'r') as file:
-            server_structures = json.load(file)
-            logging.info(f"Loaded server structures from {filename}: {json.dumps(server_structures, indent=4)}")
-            return server_structures
-    except FileNotFoundError:
-        logging.error(f"Structure file {filename} not found.")
+        server_structures = storage.load_structures(server_id, corporation_id)
+    except ValueError as e:
+        logging.error(f"Error decoding structures of server {server_id} and corporation {corporation_id}: {e}")
         return {}
-    except json.JSONDecodeError as e:
-        logging.error(f"Error decoding JSON from file {filename}: {e}")
+
+    if server_structures is None:
+        logging.error(f"No structures saved for server {server_id} and corporation {corporation_id}.")
         return {}
+    logging.info(f"Loaded server structures for server {server_id} and corporation {corporation_id}: {json.dumps(server_structures, indent=4)}")
+    return server_structures
+
+def load_moon_goo(server_id):
+    """Load the goo holdings of a server (structure name -> item name -> quantity), None if never saved."""
+    return storage.load_goo(server_id)
+
+def save_moon_goo(server_id, holdings):
+    storage.save_goo(server_id, holdings)
 
 def save_results_to_file(df):
     result_file_path = "moon_goo_calculation_results.txt"
@@ -210,33 +259,24 @@ def save_results_to_file(df):
     logging.info(f"Results saved to {result_file_path}")
 
 def load_all_tokens():
-    """Load all tokens from files."""
+    """Load all tokens from the storage backend."""
     all_tokens = {}
-    for filename in os.listdir():
-        if filename.endswith("_token.json"):
-            parts = filename.split('_')
-            if len(parts) >= 3:
-                server_id = parts[0]
-                corporation_id = parts[1]
-                token_data = load_token(server_id, corporation_id)
-                if token_data:
-                    if server_id not in all_tokens:
-                        all_tokens[server_id] = {}
-                    all_tokens[server_id][corporation_id] = token_data
+    for server_id, corporation_id in registry.token_targets():
+        token_data = load_token(server_id, corporation_id)
+        if token_data:
+            if server_id not in all_tokens:
+                all_tokens[server_id] = {}
+            all_tokens[server_id][corporation_id] = token_data
     return all_tokens
 
 def get_all_server_ids():
     """Retrieve all server IDs."""
-    # Load server structures from the tokens file instead
-    server_ids = set()
-    for filename in os.listdir():
-        if filename.endswith("_token.json"):
-            server_id = filename.split('_')[0]
-            server_ids.add(server_id)
-    
-    return list(server_ids)
+    # Servers with at least one token, from the in-memory registry
+    return registry.server_ids()
 
 
 # Load configurations and tokens when the module is imported
 load_config()
+storage = create_storage(get_config('storage_backend', 'json'), get_config('storage_database', 'moongoo.db'), get_config('storage_flush_delay', 1.0))
+registry.source = storage.list_entries
 initialize_tokens_file()
@@ -0,0 +1,387 @@
+import aiohttp
+import asyncio
+import base64
+import codecs
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from config import get_config
+from bot_statistics import increment_metric, set_metric
+
+logging.basicConfig(level=logging.INFO)
+
+ESI_BASE_URL = 'https://esi.evetech.net/latest'
+ESI_HOST = 'esi.evetech.net'
+
+
+class CacheEntry:
+    def __init__(self, data, etag, expires, pages, last_modified):
+        self.data = data
+        self.etag = etag
+        self.expires = expires
+        self.pages = pages
+        self.last_modified = last_modified
+
+
+class ResponseCache:
+    """Conditional-request cache for ESI GET responses.
+
+    Keeps the parsed body together with the ETag and Expires headers. Inside
+    the expiry window the stored body is served without touching the network,
+    afterwards the request is revalidated with If-None-Match so a 304 skips
+    both the download and the JSON parse.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(url, params, filter_key=None, headers=None):
+        return (url, tuple(sorted((params or {}).items())), filter_key, auth_scope(headers))
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def store(self, key, data, etag, expires, pages, last_modified):
+        self._entries[key] = CacheEntry(data, etag, expires, pages, last_modified)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def auth_scope(headers):
+    """Who an authenticated request was made as, so cached responses are never shared between tokens.
+
+    EVE SSO access tokens are JWTs whose `sub` names the character, which
+    stays the same when the token is refreshed. Other tokens are keyed by
+    their hash. Unauthenticated requests return None.
+    """
+    authorization = (headers or {}).get('Authorization')
+    if not authorization:
+        return None
+    token = authorization.split(' ', 1)[-1]
+    try:
+        payload = token.split('.')[1]
+        subject = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4))).get('sub')
+        if subject:
+            return subject
+    except (IndexError, ValueError, AttributeError):
+        pass
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def parse_expires(headers):
+    """Convert the Expires header into a unix timestamp (0 if missing or invalid)."""
+    return parse_http_date(headers.get('Expires')) or 0
+
+def parse_last_modified(headers, default=None):
+    """Unix timestamp of the Last-Modified header, i.e. when ESI generated the data (default if missing)."""
+    return parse_http_date(headers.get('Last-Modified')) or default
+
+def parse_http_date(value):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+class ESIRateLimiter:
+    """Global token bucket for ESI requests that respects the ESI error budget.
+
+    Every ESI request takes a token; tokens refill at `rate` per second up to
+    `burst`. After each response the X-ESI-Error-Limit-Remain/-Reset headers
+    are read: below `slowdown_threshold` remaining errors the refill rate is
+    scaled down proportionally, and at or below `error_floor` (or on a 420)
+    all callers are paused until the error window resets.
+    """
+
+    ERROR_BUDGET = 100  # ESI allows 100 errors per window
+
+    def __init__(self, rate=20, burst=40, error_floor=10, slowdown_threshold=50, min_rate=1):
+        self.rate = rate
+        self.burst = burst
+        self.error_floor = error_floor
+        self.slowdown_threshold = slowdown_threshold
+        self.min_rate = min_rate
+        self.current_rate = rate
+        self.error_limit_remain = self.ERROR_BUDGET
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._paused_until = 0
+        self._publish_metrics()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.current_rate)
+        self._last_refill = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.current_rate)
+
+    def update(self, status, headers):
+        remain = headers.get('X-ESI-Error-Limit-Remain')
+        reset = headers.get('X-ESI-Error-Limit-Reset')
+        if remain is None:
+            return
+
+        try:
+            remain = int(remain)
+            reset = int(reset) if reset is not None else 60
+        except ValueError:
+            return
+
+        self.error_limit_remain = remain
+        if remain >= self.slowdown_threshold:
+            self.current_rate = self.rate
+        else:
+            self.current_rate = max(self.min_rate, self.rate * remain / self.slowdown_threshold)
+
+        if status == 420 or remain <= self.error_floor:
+            self._paused_until = max(self._paused_until, time.monotonic() + reset)
+            self._tokens = 0
+            increment_metric('esi_rate_limit_pauses')
+            logging.warning(f"ESI error budget low ({remain} left), pausing ESI requests for {reset}s.")
+
+        self._publish_metrics()
+
+    def _publish_metrics(self):
+        set_metric('esi_rate_limit_current_rate', round(self.current_rate, 2))
+        set_metric('esi_error_limit_remain', self.error_limit_remain)
+
+
+async def iter_json_array(response, chunk_size=65536):
+    """Yield the items of a top-level JSON array while the body is still downloading.
+
+    Only the current chunk plus one partially received item is held in memory,
+    so callers that drop most items keep a bounded footprint no matter how
+    large the array is. Items may be any JSON value: an item is only taken
+    once the ',' or ']' after it has arrived, since a number cut off at a
+    chunk boundary (`[12` or `[4.5` of `[123, 4.5e3]`) would otherwise
+    decode as a different value.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    started = False
+    finished = False
+
+    async for chunk in response.content.iter_chunked(chunk_size):
+        buffer += text_decoder.decode(chunk)
+        pos = 0
+        while not finished:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                finished = True
+                break
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # Item is not complete yet, wait for the next chunk
+            separator = end
+            while separator < len(buffer) and buffer[separator] in ' \t\r\n':
+                separator += 1
+            if separator >= len(buffer) or buffer[separator] not in ',]':
+                break  # The item may continue in the next chunk
+            pos = end
+            yield item
+        buffer = buffer[pos:]
+
+    if not finished:
+        raise ValueError("Truncated JSON array in response")
+
+
+class ESIClient:
+    """Long-lived HTTP client shared by every module that talks to ESI.
+
+    One aiohttp session (and therefore one keep-alive connection pool) is
+    created at bot startup and reused for every request, so commands and
+    background tasks no longer pay a new TCP+TLS handshake per call.
+    """
+
+    def __init__(self, limit=100, limit_per_host=20, keepalive_timeout=60, page_concurrency=8, page_timeout=30, cache_max_entries=1024, rate_limiter=None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.page_concurrency = page_concurrency
+        self.page_timeout = page_timeout
+        self.cache = ResponseCache(cache_max_entries)
+        self.rate_limiter = rate_limiter or ESIRateLimiter()
+        self._session = None
+
+    def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(connector=connector)
+        logging.info(f"ESI client started (limit={self.limit}, limit_per_host={self.limit_per_host}).")
+        return self._session
+
+    async def start(self):
+        """Create the pooled session. Safe to call more than once."""
+        if self._session is None or self._session.closed:
+            self._create_session()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logging.info("ESI client closed.")
+        self._session = None
+
+    @property
+    def session(self):
+        # Lazily create the session if a call site runs before on_ready
+        if self._session is None or self._session.closed:
+            self._create_session()
+        return self._session
+
+    @asynccontextmanager
+    async def request(self, method, url, **kwargs):
+        # Only ESI itself is throttled, other hosts (SSO, market APIs) share the pool only
+        limited = urlparse(str(url)).hostname == ESI_HOST
+        if limited:
+            await self.rate_limiter.acquire()
+        async with self.session.request(method, url, **kwargs) as response:
+            if limited:
+                self.rate_limiter.update(response.status, response.headers)
+            yield response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    async def get_json(self, url, headers=None, params=None, timeout=None, row_filter=None, filter_key=None, with_last_modified=False):
+        """GET a JSON endpoint through the response cache.
+
+        Returns (data, pages) where pages is the X-Pages value of the response.
+        The returned data is shared with the cache and must not be modified.
+        With with_last_modified, returns (data, pages, last_modified): when
+        the data was generated according to Last-Modified, else when it was
+        downloaded. A cached body keeps its original time.
+
+        If row_filter is given the body (a JSON array) is parsed incrementally
+        and only rows for which row_filter(row) is true are kept. filter_key
+        names the filter so filtered and unfiltered results are cached apart.
+        """
+        key = ResponseCache.make_key(url, params, filter_key, headers)
+        entry = self.cache.get(key)
+
+        if entry is not None and time.time() < entry.expires:
+            increment_metric('esi_cache_hits')
+            return (entry.data, entry.pages, entry.last_modified) if with_last_modified else (entry.data, entry.pages)
+
+        request_headers = dict(headers or {})
+        if entry is not None and entry.etag:
+            request_headers['If-None-Match'] = entry.etag
+
+        async with self.get(url, headers=request_headers, params=params, timeout=timeout) as response:
+            if response.status == 304 and entry is not None:
+                increment_metric('esi_cache_revalidated')
+                entry.expires = parse_expires(response.headers)
+                entry.last_modified = parse_last_modified(response.headers, entry.last_modified)
+                return (entry.data, entry.pages, entry.last_modified) if with_last_modified else (entry.data, entry.pages)
+
+            increment_metric('esi_cache_misses')
+            response.raise_for_status()
+            if row_filter is not None:
+                data = [row async for row in iter_json_array(response) if row_filter(row)]
+            else:
+                data = await response.json()
+            pages = int(response.headers.get('X-Pages', 1))
+            etag = response.headers.get('ETag')
+            expires = parse_expires(response.headers)
+            last_modified = parse_last_modified(response.headers, time.time())
+            if etag or expires:
+                self.cache.store(key, data, etag, expires, pages, last_modified)
+            return (data, pages, last_modified) if with_last_modified else (data, pages)
+
+    async def _get_page(self, url, headers, params, page, row_filter=None, filter_key=None):
+        page_params = dict(params or {})
+        page_params['page'] = page
+        timeout = aiohttp.ClientTimeout(total=self.page_timeout)
+        return await self.get_json(url, headers=headers, params=page_params, timeout=timeout, row_filter=row_filter, filter_key=filter_key, with_last_modified=True)
+
+    async def get_all_pages(self, url, headers=None, params=None, max_concurrency=None, row_filter=None, filter_key=None, with_last_modified=False):
+        """Fetch every page of a paginated ESI endpoint and merge them into one list.
+
+        Page 1 is read first to learn the page count from the X-Pages header,
+        the remaining pages are then fetched concurrently (at most
+        max_concurrency at a time). Each page gets its own timeout, so the
+        total time scales with the number of pages instead of one fixed budget.
+        Raises aiohttp.ClientError / asyncio.TimeoutError if any page fails.
+        With with_last_modified, returns (data, last_modified) where
+        last_modified is the oldest time of any page.
+        """
+        first_page, pages, last_modified = await self._get_page(url, headers, params, 1, row_filter, filter_key)
+        if not isinstance(first_page, list):
+            raise aiohttp.ClientError(f"Unexpected response format from {url}")
+
+        # Copy so merging pages never mutates the cached page 1 body
+        data = list(first_page)
+        if pages <= 1:
+            return (data, last_modified) if with_last_modified else data
+
+        semaphore = asyncio.Semaphore(max_concurrency or self.page_concurrency)
+
+        async def fetch(page):
+            async with semaphore:
+                page_data, _, page_last_modified = await self._get_page(url, headers, params, page, row_filter, filter_key)
+                return page_data, page_last_modified
+
+        logging.debug(f"Fetching {pages} pages from {url}")
+        results = await asyncio.gather(*(fetch(page) for page in range(2, pages + 1)))
+        for page_data, page_last_modified in results:
+            data.extend(page_data)
+            last_modified = min(last_modified, page_last_modified)
+        return (data, last_modified) if with_last_modified else data
+
+
+esi_client = ESIClient(
+    limit=get_config('esi_connection_limit', 100),
+    limit_per_host=get_config('esi_connection_limit_per_host', 20),
+    keepalive_timeout=get_config('esi_keepalive_timeout', 60),
+    page_concurrency=get_config('esi_page_concurrency', 8),
+    page_timeout=get_config('esi_page_timeout', 30),
+    cache_max_entries=get_config('esi_cache_max_entries', 1024),
+    rate_limiter=ESIRateLimiter(
+        rate=get_config('esi_rate_limit', 20),
+        burst=get_config('esi_rate_burst', 40),
+        error_floor=get_config('esi_error_limit_floor', 10),
+        slowdown_threshold=get_config('esi_error_limit_slowdown', 50)
+    )
+)
@@ -0,0 +1,93 @@
+"""Local stand-in for the evetycoon and Janice price APIs.
+
+Serves deterministic prices so market refreshes can be run and tested
+offline. Start it and point the bot at it in config.yaml:
+
+    python fake_price_server.py --port 8089
+
+    evetycoon_base_url: http://127.0.0.1:8089/api
+    janice_base_url: http://127.0.0.1:8089/api/rest/v2
+
+--delay HUB=SECONDS makes one hub answer slowly, --fail HUB makes it return
+errors, to see how a refresh copes with a bad hub.
+"""
+import argparse
+import asyncio
+from aiohttp import web
+from pricing_sources import HUBS, JANICE_MARKETS
+
+REGION_HUBS = {str(info['region_id']): hub for hub, info in HUBS.items()}
+JANICE_MARKET_HUBS = {str(market): hub for hub, market in JANICE_MARKETS.items()}
+HUB_FACTORS = {'jita': 1.0, 'amarr': 0.97, 'dodixie': 0.94}
+
+
+def fake_prices(type_id, hub):
+    """Deterministic (buy, sell) prices that differ per type and hub."""
+    base = 100 + (int(type_id) % 997) * 7.5
+    buy = round(base * HUB_FACTORS.get(hub, 1.0), 2)
+    return buy, round(buy * 1.08, 2)
+
+
+def create_app(delays=None, failing=None):
+    delays = delays or {}
+    failing = failing or set()
+
+    async def simulate(hub):
+        if hub in delays:
+            await asyncio.sleep(delays[hub])
+        if hub in failing:
+            raise web.HTTPServiceUnavailable()
+
+    async def evetycoon_stats(request):
+        hub = REGION_HUBS.get(request.match_info['region_id'])
+        if hub is None:
+            raise web.HTTPNotFound()
+        await simulate(hub)
+        buy, sell = fake_prices(request.match_info['type_id'], hub)
+        return web.json_response({
+            "buyVolume": 1000000,
+            "sellVolume": 800000,
+            "buyOrders": 42,
+            "sellOrders": 37,
+            "buyAvgFivePercent": buy,
+            "sellAvgFivePercent": sell
+        })
+
+    async def janice_pricer(request):
+        hub = JANICE_MARKET_HUBS.get(request.query.get('market', '2'))
+        if hub is None:
+            raise web.HTTPNotFound()
+        if not request.headers.get('X-ApiKey'):
+            raise web.HTTPUnauthorized()
+        await simulate(hub)
+        buy, sell = fake_prices(request.match_info['type_id'], hub)
+        return web.json_response({
+            "market": {"id": JANICE_MARKETS[hub], "name": hub},
+            "buyOrderCount": 42,
+            "buyVolume": 1000000,
+            "sellOrderCount": 37,
+            "sellVolume": 800000,
+            "immediatePrices": {"buyPrice": buy, "sellPrice": sell},
+            "top5AveragePrices": {"buyPrice": buy, "sellPrice": sell},
+            "itemType": {"eid": int(request.match_info['type_id'])}
+        })
+
+    app = web.Application()
+    app.router.add_get('/api/v1/market/stats/{region_id}/{type_id}', evetycoon_stats)
+    app.router.add_get('/api/rest/v2/pricer/{type_id}', janice_pricer)
+    return app
+
+
+def parse_delay(value):
+    hub, seconds = value.split('=', 1)
+    return hub, float(seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake evetycoon/Janice price API for offline testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--delay', type=parse_delay, action='append', default=[], metavar='HUB=SECONDS')
+    parser.add_argument('--fail', action='append', default=[], metavar='HUB')
+    args = parser.parse_args()
+    web.run_app(create_app(dict(args.delay), set(args.fail)), host=args.host, port=args.port)
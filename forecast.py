@@ -0,0 +1,131 @@
+import time
+from array import array
+import numpy as np
+from config import get_config, get_server_config
+
+# In-game consumption of a Metenox Moon Drill
+GAS_PER_HOUR = 150
+FUEL_PER_HOUR = 5
+RESOURCES = ('magmatic_gas', 'fuel_blocks')
+CONSUMPTION_RATES = np.array([GAS_PER_HOUR, FUEL_PER_HOUR], dtype=np.float64)
+# Oxygen, Nitrogen, Hydrogen and Helium Fuel Blocks, a drill burns any of them (same list as !checkgas)
+FUEL_BLOCK_TYPE_IDS = (4312, 4246, 4247, 4051)
+
+# Hours of remaining gas/fuel at which an alert is sent, unless a server overrides them
+ALERT_THRESHOLDS = (48, 24)
+
+# Defaults of alert_min_check_interval / alert_max_check_interval, read on every check
+MIN_CHECK_INTERVAL = 900
+MAX_CHECK_INTERVAL = 43200
+CROSSING_MARGIN = 60  # Check shortly after a crossing so the threshold is already passed
+
+
+def get_server_thresholds(server_id):
+    """Alert thresholds in hours for a server, highest first (server_alert_thresholds, else alert_thresholds)."""
+    thresholds = get_server_config('server_alert_thresholds', server_id) or get_config('alert_thresholds', list(ALERT_THRESHOLDS))
+    return tuple(sorted((float(hours) for hours in thresholds), reverse=True))
+
+
+class DrillLevels:
+    """Gas and fuel amounts of many drills, collected row by row and evaluated as arrays.
+
+    Consumption is constant, so the amounts seen in an asset snapshot fix
+    each drill's depletion time and every threshold crossing until someone
+    refuels. Rows may come from any number of servers, each with its own
+    thresholds.
+    """
+
+    def __init__(self):
+        self.server_ids = []
+        self.corporation_ids = []
+        self.structure_ids = []
+        self.structure_names = []
+        # Typed arrays so evaluate() can wrap them without converting Python lists
+        self._gas = array('d')
+        self._fuel = array('d')
+        self._observed_at = array('d')
+        self._threshold_sets = {}  # thresholds tuple -> index, servers mostly share the defaults
+        self._threshold_index = array('q')
+
+    def __len__(self):
+        return len(self.structure_ids)
+
+    def add(self, server_id, corporation_id, structure_id, structure_name, gas, fuel, observed_at, thresholds):
+        self.server_ids.append(server_id)
+        self.corporation_ids.append(corporation_id)
+        self.structure_ids.append(structure_id)
+        self.structure_names.append(structure_name)
+        self._gas.append(gas)
+        self._fuel.append(fuel)
+        self._observed_at.append(observed_at)
+        self._threshold_index.append(self._threshold_sets.setdefault(tuple(thresholds), len(self._threshold_sets)))
+
+    def amount(self, row, resource):
+        return int((self._gas if resource == 'magmatic_gas' else self._fuel)[row])
+
+    def evaluate(self, now=None):
+        now = time.time() if now is None else now
+        amounts = np.column_stack((np.frombuffer(self._gas, dtype=np.float64), np.frombuffer(self._fuel, dtype=np.float64)))
+        observed_at = np.frombuffer(self._observed_at, dtype=np.float64)
+
+        # One padded row per distinct threshold set (NaN where a set is shorter), then gathered per drill
+        width = max((len(thresholds) for thresholds in self._threshold_sets), default=0)
+        threshold_table = np.full((len(self._threshold_sets), width), np.nan)
+        for thresholds, index in self._threshold_sets.items():
+            threshold_table[index, :len(thresholds)] = thresholds
+        thresholds = threshold_table[np.frombuffer(self._threshold_index, dtype=np.int64)].reshape(len(self), width)
+
+        return ThresholdEvaluation(self, amounts, observed_at, thresholds, now)
+
+
+class ThresholdEvaluation:
+    """Hours remaining, crossed alert level and next crossing of every drill and resource.
+
+    level[row, resource] is the lowest threshold the remaining time is below
+    (inf if none), next_crossing[row] the earliest upcoming crossing of any
+    threshold of that drill (inf if none).
+    """
+
+    def __init__(self, levels, amounts, observed_at, thresholds, now):
+        self.levels = levels
+        self.now = now
+
+        depletion = observed_at[:, None] + amounts / CONSUMPTION_RATES * 3600
+        self.hours_remaining = np.maximum(depletion - now, 0) / 3600
+
+        self.level = np.full(amounts.shape, np.inf)
+        self.next_crossing = np.full(len(amounts), np.inf)
+
+        # Few threshold columns, many rows: loop over the columns, NaN padding never compares true
+        with np.errstate(invalid='ignore'):
+            for column in range(thresholds.shape[1]):
+                threshold = np.ascontiguousarray(thresholds[:, column])[:, None]
+                self.level = np.where(self.hours_remaining < threshold, np.minimum(self.level, threshold), self.level)
+
+                crossings = depletion - threshold * 3600 + CROSSING_MARGIN
+                crossings = np.where(crossings > now, crossings, np.inf)
+                self.next_crossing = np.minimum(self.next_crossing, np.minimum(crossings[:, 0], crossings[:, 1]))
+
+    def alerts(self):
+        """Yield (row, resource, level_hours, hours_remaining, amount) for every crossed threshold only."""
+        rows, resources = np.nonzero(np.isfinite(self.level))
+        for row, resource in zip(rows.tolist(), resources.tolist()):
+            alert_type = RESOURCES[resource]
+            yield row, alert_type, self.level[row, resource], self.hours_remaining[row, resource], self.levels.amount(row, alert_type)
+
+    def earliest_crossing(self):
+        return self.next_crossing.min(initial=np.inf)
+
+    def next_check(self, min_interval=None, max_interval=None):
+        """When to check these drills again.
+
+        That is the earliest upcoming threshold crossing, clamped so drills
+        about to cross are checked at most every min_interval seconds and
+        drills with weeks of fuel at least every max_interval seconds (to
+        notice refuels and drills going offline).
+        """
+        min_interval = get_config('alert_min_check_interval', MIN_CHECK_INTERVAL) if min_interval is None else min_interval
+        max_interval = get_config('alert_max_check_interval', MAX_CHECK_INTERVAL) if max_interval is None else max_interval
+        next_crossing = self.earliest_crossing()
+        return float(min(max(next_crossing, self.now + min_interval), self.now + max_interval))
+
@@ -2,45 +2,132 @@ import os
 import asyncio
 import logging
 import json
-import requests
+import time
+import copy
 import discord
 import pandas as pd 
+from datetime import datetime, timezone
 from moongoo import get_moon_goo_items
+from pricing_sources import HUBS, build_price_sources, fetch_hub_stats
+from moongoo_commands import load_moon_goo_from_json
+from valuation import GooValuation
+from price_history import price_history
+from config import get_config, get_server_config
+from bot_statistics import record_timing, set_metric
+from storage import write_atomic
 
-API_URL = "https://evetycoon.com/api/v1/market/stats/10000002"
 SAVE_FILE = "market_stats.json"
-REGION_ID = '10000002'  # Region ID for The Forge
 MOON_GOO_ITEMS_FILE = 'metenox_goo.json'  # File with moon goo items
-API_BASE_URL = "https://evetycoon.com/api"
+# Defaults of the market settings, which are read from config.yaml when used so edits apply without a restart
+MARKET_FETCH_CONCURRENCY = 5  # Parallel requests per hub
+MARKET_HUB_DEADLINE = 60  # Seconds a hub may take before its missing items are skipped
+PRICE_MODE = 'current'  # 'current' or 'twap'
+PRICE_HUBS = list(HUBS)
+DEFAULT_PRICE_HUB = 'jita'
+MARKET_MAX_AGE = 6 * 3600  # Seconds before a report triggers a refresh
+MARKET_RETRY_INTERVAL = 300  # Seconds between attempts while refreshes fail
+
+def get_default_price_hub():
+    return get_config('default_price_hub', DEFAULT_PRICE_HUB)
+
+def get_server_price_hub(server_id):
+    """Return the trade hub a server's goo is valued at (server_price_hubs, else default_price_hub)."""
+    return get_server_config('server_price_hubs', server_id) or get_default_price_hub()
+
+def previous_hub_stats(previous_stats, type_id, hub):
+    """Last known stats of an item at a hub, also reading the old flat (Jita only) file format."""
+    entry = previous_stats.get(type_id)
+    if not entry:
+        return None
+    if 'hubs' in entry:
+        return entry['hubs'].get(hub)
+    if hub == get_default_price_hub():
+        return entry
+    return None
+
+async def fetch_hub_market_stats(sources, hub, type_ids):
+    """Fetch all items at one hub. Returns {type_id: stats} for the items that succeeded.
+
+    Items still outstanding after market_hub_deadline seconds are cancelled,
+    so one slow hub or source cannot hold up the whole refresh.
+    """
+    semaphore = asyncio.Semaphore(get_config('market_fetch_concurrency', MARKET_FETCH_CONCURRENCY))
+
+    async def fetch(type_id):
+        async with semaphore:
+            return type_id, await fetch_hub_stats(sources, type_id, hub)
+
+    fetches = [asyncio.ensure_future(fetch(type_id)) for type_id in type_ids]
+    done, pending = await asyncio.wait(fetches, timeout=get_config('market_hub_deadline', MARKET_HUB_DEADLINE))
+    for task in pending:
+        task.cancel()
+    if pending:
+        logging.warning(f"Market hub {hub} did not answer in time for {len(pending)} items.")
+
+    hub_stats = {}
+    for task in done:
+        type_id, stats = task.result()
+        if stats is not None:
+            hub_stats[str(type_id)] = stats
+    return hub_stats
 
 async def fetch_market_stats_for_items():
+    """Refresh market_stats.json for all moon goo items at every configured hub.
+
+    The hubs (price_hubs) are fetched in parallel, each through the price
+    sources in priority order (price_sources). Every item keeps its per-hub
+    stats under "hubs"; the default hub is also stored at the top level so
+    the file stays readable in the old flat format. An item that fails keeps
+    its last known good stats, whose fetchedAt timestamp then shows how
+    stale it is.
+    """
     try:
+        started = time.perf_counter()
         moon_goo_items = get_moon_goo_items()  # Get the type IDs of moon goo items
+        previous_stats = load_market_stats()
+        sources = build_price_sources()
+        default_hub = get_default_price_hub()
+        hubs = [hub for hub in get_config('price_hubs', PRICE_HUBS) if hub in HUBS]
+        if default_hub in HUBS and default_hub not in hubs:
+            hubs.append(default_hub)
         market_stats = {}
+        fresh_stats = {}
+        failed = 0
 
-        for type_id, item_name in moon_goo_items.items():
-            url = f"{API_BASE_URL}/v1/market/stats/10000002/{type_id}"
-            response = requests.get(url)
-
-            if response.status_code == 200:
-                data = response.json()
-                market_stats[type_id] = {
-                    "buyVolume": data["buyVolume"],
-                    "sellVolume": data["sellVolume"],
-                    "buyOrders": data["buyOrders"],
-                    "sellOrders": data["sellOrders"],
-                    "buyAvgFivePercent": data["buyAvgFivePercent"],
-                    "sellAvgFivePercent": data["sellAvgFivePercent"]
-                }
-                logging.debug(f"Fetched market stats for item: {item_name}")
-            else:
-                logging.error(f"Failed to fetch data for {item_name}: {response.status_code}")
+        results = await asyncio.gather(*(fetch_hub_market_stats(sources, hub, moon_goo_items) for hub in hubs))
 
-        # Save market stats to a JSON file, replacing the old file
-        with open(SAVE_FILE, 'w') as f:
-            json.dump(market_stats, f, indent=4)
+        for hub, hub_stats in zip(hubs, results):
+            for type_id, item_name in moon_goo_items.items():
+                key = str(type_id)
+                stats = hub_stats.get(key)
+                if stats is None:
+                    failed += 1
+                    stats = previous_hub_stats(previous_stats, key, hub)
+                    if stats is None:
+                        continue
+                    logging.warning(f"Keeping last known {hub} market stats for {item_name}.")
+                elif hub == default_hub:
+                    fresh_stats[key] = stats
+                market_stats.setdefault(key, {'hubs': {}})['hubs'][hub] = stats
 
-        logging.info(f"Market stats updated and saved to {SAVE_FILE}")
+        # Append only freshly fetched prices to the history, then attach the rolling TWAP/volatility
+        price_history.record(fresh_stats)
+        for type_id, entry in market_stats.items():
+            default_stats = entry['hubs'].get(default_hub)
+            if default_stats is not None:
+                default_stats.update(price_history.smoothed(type_id))
+                entry.update(default_stats)
+
+        # Save market stats to a JSON file, replacing the old file atomically and off the loop
+        await asyncio.to_thread(write_atomic, SAVE_FILE, json.dumps(market_stats, indent=4))
+
+        # Swap the in-memory price table in one assignment
+        set_price_table(PriceTable(market_stats))
+
+        elapsed = time.perf_counter() - started
+        record_timing('market_refresh', elapsed)
+        set_metric('market_refresh_failed_items', failed)
+        logging.info(f"Market stats for {', '.join(hubs)} updated and saved to {SAVE_FILE} in {elapsed:.2f}s ({failed} items failed)")
 
     except Exception as e:
         logging.error(f"Failed to fetch market stats: {str(e)}")
@@ -83,46 +170,16 @@ async def calculate_market_data():
 async def calculate_moon_goo_values(ctx):
     try:
         # Load moon goo assets from MongoDB or JSON
-        moon_goo_data = await get_moon_goo_items(ctx.guild.id)  # Load moon goo data by server ID
+        server_id = str(ctx.guild.id)
+        moon_goo_data = await load_moon_goo_from_json(server_id)  # Load moon goo data by server ID
         if not moon_goo_data:
             await ctx.send("No moon goo data available.")
             return
 
-        # Load market stats from JSON
-        with open('market_stats.json', 'r') as market_file:
-            market_stats = json.load(market_file)
-
-        # Initialize data structure for storing results
-        result_data = []
-
-        # Process moon goo amounts and calculate values
-        for station, items in moon_goo_data.items():
-            for item_name, quantity in items.items():
-                # Get the item type ID (Assume you have a mapping of item_name to type_id)
-                type_id = get_type_id_from_name(item_name)
-
-                # Fetch market stats for this item
-                market_info = market_stats.get(str(type_id), {})
-                buy_price = market_info.get('buyAvgFivePercent', 0)
-                sell_price = market_info.get('sellAvgFivePercent', 0)
-
-                # Calculate total values
-                total_buy_value = buy_price * quantity
-                total_sell_value = sell_price * quantity
-
-                # Append the data for this station and item
-                result_data.append({
-                    'Station': station,
-                    'Item': item_name,
-                    'Quantity': quantity,
-                    'Buy Price (Unit)': buy_price,
-                    'Sell Price (Unit)': sell_price,
-                    'Total Buy Value': total_buy_value,
-                    'Total Sell Value': total_sell_value
-                })
-
-        # Convert the results to a DataFrame for a tabular display (Excel-like)
-        df = pd.DataFrame(result_data)
+        # Value all stations and items in one vectorized pass and build the table column-wise
+        price_table = await ensure_fresh_prices()
+        valuation = GooValuation(moon_goo_data).value(price_table.for_hub(get_server_price_hub(server_id)))
+        df = pd.DataFrame(valuation.rows())
 
         # Print the table in an Excel-like format in chunks
         result_str = df.to_string(index=False)
@@ -152,11 +209,6 @@ async def send_message_in_chunks(interaction: discord.Interaction, message: str,
     if message:
         await interaction.response.send_message(message)
 
-# Utility to get item type_id from the name (This assumes you have some mapping function)
-def get_type_id_from_name(item_name):
-    moon_goo_items = get_moon_goo_items()  # Load moon goo item ID mapping
-    return moon_goo_items.get(item_name)
-
 def format_number(num):
     if num >= 1_000_000:
         return f'{num / 1_000_000:.1f}M'
@@ -171,4 +223,114 @@ def load_market_stats():
     if os.path.exists(market_stats_path):
         with open(market_stats_path, 'r') as f:
             return json.load(f)
-    return {}
\ No newline at end of file
+    return {}
+
+
+class PriceTable:
+    """Immutable in-memory view of market_stats.json.
+
+    Indexed by type ID and by item name so report commands can price every
+    item with a dict lookup. A refresh builds a new table and swaps it in,
+    readers never see a partially updated one.
+
+    With price_mode 'twap' items are valued at the rolling time-weighted
+    average from the price history, falling back to the current price for
+    items without history yet. The history is kept for the default hub only.
+
+    for_hub() returns a view that prices at another trade hub; items the hub
+    has no stats for fall back to the default hub.
+    """
+
+    def __init__(self, market_stats, price_mode=None, hub=None):
+        self.price_mode = price_mode  # None follows price_mode in config.yaml
+        self.hub = hub
+        self.by_type_id = {int(type_id): stats for type_id, stats in market_stats.items()}
+        # Oldest stats of any item and hub, so one kept "last known good" price makes the table stale
+        self.fetched_at = min((parse_fetched_at(hub_stats.get('fetchedAt'))
+                               for stats in self.by_type_id.values()
+                               for hub_stats in (stats.get('hubs') or {'': stats}).values()), default=0)
+        moon_goo_items = get_moon_goo_items()
+        self.by_name = {moon_goo_items[type_id]: stats for type_id, stats in self.by_type_id.items() if type_id in moon_goo_items}
+
+    def get(self, type_id):
+        return self.by_type_id.get(int(type_id))
+
+    def get_by_name(self, item_name):
+        return self.by_name.get(item_name)
+
+    def for_hub(self, hub):
+        view = copy.copy(self)
+        view.hub = hub
+        return view
+
+    def prices(self, item_name):
+        """Return (buy, sell) unit prices for an item name, 0 if unknown."""
+        stats = self.by_name.get(item_name) or {}
+        if self.hub is not None:
+            stats = stats.get('hubs', {}).get(self.hub) or stats
+        buy, sell = stats.get('buyAvgFivePercent', 0), stats.get('sellAvgFivePercent', 0)
+        if (self.price_mode or get_config('price_mode', PRICE_MODE)) == 'twap':
+            buy = stats.get('buyTwap') or buy
+            sell = stats.get('sellTwap') or sell
+        return buy, sell
+
+
+def parse_fetched_at(value):
+    """Convert a fetchedAt timestamp ("2024-01-01T00:00:00Z") to unix time, 0 if missing or invalid."""
+    if not value:
+        return 0
+    try:
+        return datetime.fromisoformat(value.rstrip('Z')).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return 0
+
+
+_price_table = None
+_refresh_task = None
+_last_refresh_attempt = 0
+
+def get_price_table():
+    """Return the process-wide price table, loading market_stats.json on first use."""
+    global _price_table
+    if _price_table is None:
+        try:
+            _price_table = PriceTable(load_market_stats())
+        except (IOError, json.JSONDecodeError) as e:
+            logging.error(f"Error loading market stats: {e}")
+            return PriceTable({})
+    return _price_table
+
+def set_price_table(price_table):
+    global _price_table
+    _price_table = price_table
+
+async def ensure_fresh_prices(max_age=None, wait=True):
+    """Return the price table, refreshing the market stats first if they are older than max_age seconds.
+
+    There are no periodic refreshes: the first report that finds stale
+    prices starts one refresh and every report arriving meanwhile waits for
+    that same refresh. With wait=False (e.g. interactions that must answer
+    within 3 seconds) the stale prices are returned right away while the
+    refresh runs, unless there are no prices at all. While refreshes keep
+    failing a new attempt is made at most every market_retry_interval
+    seconds, in between the last known prices are used.
+    """
+    global _refresh_task, _last_refresh_attempt
+    max_age = get_config('market_max_age', MARKET_MAX_AGE) if max_age is None else max_age
+    price_table = get_price_table()
+    if time.time() - price_table.fetched_at <= max_age:
+        return price_table
+
+    if _refresh_task is None or _refresh_task.done():
+        if _last_refresh_attempt and time.monotonic() - _last_refresh_attempt < get_config('market_retry_interval', MARKET_RETRY_INTERVAL):
+            return price_table
+        _last_refresh_attempt = time.monotonic()
+        logging.info(f"Market stats are older than {max_age}s, refreshing.")
+        _refresh_task = asyncio.ensure_future(fetch_market_stats_for_items())
+
+    if not wait and price_table.by_type_id:
+        return price_table
+
+    # Shield so a cancelled report does not cancel the refresh other reports wait on
+    await asyncio.shield(_refresh_task)
+    return get_price_table()
@@ -1,18 +1,17 @@
 import pymongo
+import asyncio
 import logging
 from datetime import datetime
 from collections import defaultdict
-import os
 import yaml
-import json
 from bson import ObjectId
-from administration import get_access_token, fetch_corporation_name
-from structurecommands import get_all_structure_assets, get_moon_drills, get_structure_name
+from administration import extract_corporation_id_from_filename
+from names import name_resolver
+from assets import asset_snapshots
+from structurecommands import get_all_structure_assets, get_moon_drills
 from moongoo import get_moon_goo_items
-from moongoo_commands import load_moon_goo_from_json
-from config import save_server_structures, get_config
-import config
-import requests
+from config import save_server_structures, load_server_structures
+from registry import registry
 
 # Load MongoDB config from MongoDB-config.yaml
 def load_mongodb_config():
@@ -52,28 +51,23 @@ def save_to_mongodb(data, collection_name, server_id):
 # Async function to collect gas data
 async def collect_gas_data(server_id):
     try:
-        # Fetch the access token for the server
-        access_token = await get_access_token(server_id)
-        if not access_token:
-            return 'Failed to get access token'
+        corporation_id = extract_corporation_id_from_filename(server_id)
+        if not corporation_id:
+            return 'Failed to get corporation ID'
 
-        headers = {'Authorization': f'Bearer {access_token}'}
-        corporation_id = config.get_config("corporation_id", server_id)
-        url = f'https://esi.evetech.net/latest/corporations/{corporation_id}/assets/?datasource=tranquility'
-        response = requests.get(url, headers=headers)
-        data = response.json()
-
-        if 'error' in data:
-            return f"Error fetching gas data: {data['error']}"
+        # Read from the shared per-corporation asset snapshot instead of downloading the assets again
+        snapshot = await asset_snapshots.get(server_id, corporation_id)
+        structure_info = load_server_structures(server_id, corporation_id).get('structure_info', {})
 
         # Process and extract gas-related assets
         gas_data = {}
-        for asset in data:
-            if asset.get('location_flag') == 'StructureFuel' and asset.get('type_id') == 81143:  # Magmatic Gas ID
-                gas_data[asset.get('location_id')] = {
-                    "quantity": asset.get('quantity'),
-                    "structure_name": config.get_structure_name(asset.get('location_id'), server_id)  # Function to get structure name
-                }
+        for location_id, assets in snapshot.group(flags={'StructureFuel'}).items():
+            for asset in assets:
+                if asset.get('type_id') == 81143:  # Magmatic Gas ID
+                    gas_data[location_id] = {
+                        "quantity": asset.get('quantity'),
+                        "structure_name": structure_info.get(str(location_id), 'Unknown Structure')
+                    }
 
         return gas_data
 
@@ -84,38 +78,27 @@ async def collect_gas_data(server_id):
 # Async function to collect goo data
 async def collect_goo_data(server_id):
     try:
-        # Load moon goo items dynamically from JSON file
-        moon_goo_items = await load_moon_goo_from_json()
-        logging.info(f"Loaded moon goo items: {moon_goo_items}")
-
-        # Fetch the access token for the server
-        access_token = await get_access_token(server_id)
-        if not access_token:
-            return 'Failed to get access token'
+        moon_goo_items = get_moon_goo_items()
 
-        headers = {'Authorization': f'Bearer {access_token}'}
-        corporation_id = get_config("corporation_id", server_id)
-        url = f'https://esi.evetech.net/latest/corporations/{corporation_id}/assets/?datasource=tranquility'
-        response = requests.get(url, headers=headers)
-        data = response.json()
+        corporation_id = extract_corporation_id_from_filename(server_id)
+        if not corporation_id:
+            return 'Failed to get corporation ID'
 
-        if 'error' in data:
-            return f"Error fetching goo data: {data['error']}"
+        # Read from the shared per-corporation asset snapshot instead of downloading the assets again
+        snapshot = await asset_snapshots.get(server_id, corporation_id)
+        structure_info = load_server_structures(server_id, corporation_id).get('structure_info', {})
 
         # Initialize data structure for storing goo-related assets
         goo_data = defaultdict(lambda: defaultdict(int))
 
-        # Loop through assets and check for goo type IDs
-        for asset in data:
-            location_flag = asset.get('location_flag')
-            type_id = asset.get('type_id')
-            quantity = asset.get('quantity', 0)
-            location_id = asset.get('location_id')
-
-            if location_flag == 'StructureFuel' and type_id in moon_goo_items:
-                structure_name = get_structure_name(location_id, server_id)  # Function to get structure name
-                item_name = moon_goo_items[type_id]  # Get item name from moon goo items
-                goo_data[structure_name][item_name] += quantity
+        # Loop through the moon material bays and check for goo type IDs
+        for location_id, assets in snapshot.group(flags={'MoonMaterialBay'}).items():
+            structure_name = structure_info.get(str(location_id), 'Unknown Structure')
+            for asset in assets:
+                type_id = asset.get('type_id')
+                if type_id in moon_goo_items:
+                    item_name = moon_goo_items[type_id]  # Get item name from moon goo items
+                    goo_data[structure_name][item_name] += asset.get('quantity', 0)
 
         return goo_data
 
@@ -127,17 +110,17 @@ async def collect_moon_goo_data_and_save(server_id, structure_name=None):
     moon_goo_items = get_moon_goo_items()
     logging.info(f"Loaded moon goo items: {moon_goo_items}")
 
-    # Collect all structure files for the server
-    structure_files = [f for f in os.listdir('.') if f.startswith(f"{server_id}_") and f.endswith("_structures.json")]
+    # Corporations of the server with saved structures
+    corporation_ids = registry.structure_corporations(server_id)
 
-    if not structure_files:
-        logging.error(f"No structure info files found for server {server_id}.")
+    if not corporation_ids:
+        logging.error(f"No structure info found for server {server_id}.")
         return
 
     moon_drill_assets = defaultdict(lambda: defaultdict(int))
 
     async def fetch_and_aggregate_assets(ids, corporation_id, corp_name):
-        all_assets_info = await get_all_structure_assets(ids, server_id)
+        all_assets_info = await get_all_structure_assets(ids, server_id, corporation_id)
         if isinstance(all_assets_info, str):
             logging.error(all_assets_info)
             return
@@ -156,15 +139,13 @@ async def collect_moon_goo_data_and_save(server_id, structure_name=None):
                     item_name = moon_goo_items[type_id]
                     moon_drill_assets[f"{corp_name} - {structure_name_in_info}"][item_name] += quantity
 
-    for structure_file in structure_files:
-        corporation_id = structure_file.replace(f"{server_id}_", "").replace("_structures.json", "")
-        corp_name = await fetch_corporation_name(corporation_id)
+    corp_names = await name_resolver.resolve(corporation_ids)
+
+    for corporation_id in corporation_ids:
+        corp_name = corp_names.get(int(corporation_id), f"Corporation {corporation_id}")
 
-        try:
-            with open(structure_file, 'r') as file:
-                server_structures = json.load(file)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logging.error(f"Error loading or parsing {structure_file}: {e}")
+        server_structures = load_server_structures(server_id, corporation_id)
+        if not server_structures:
             continue
 
         moon_drill_ids = server_structures.get('metenox_moon_drill_ids', [])
@@ -186,5 +167,5 @@ async def collect_moon_goo_data_and_save(server_id, structure_name=None):
         logging.info("mongodb Error: No moon goo data found.")
         return
 
-    # Save the aggregated moon drill assets to MongoDB
-    save_to_mongodb(moon_drill_assets, "moon_goo_data", server_id)
\ No newline at end of file
+    # Save the aggregated moon drill assets to MongoDB (pymongo is blocking, keep it off the event loop)
+    await asyncio.to_thread(save_to_mongodb, moon_drill_assets, "moon_goo_data", server_id)
\ No newline at end of file
@@ -21,5 +21,11 @@ MOON_GOO_ITEMS = {
     16653: 'Thulium'
 }
 
+# Reverse index for name -> type ID lookups
+MOON_GOO_TYPE_IDS = {name: type_id for type_id, name in MOON_GOO_ITEMS.items()}
+
 def get_moon_goo_items():
-    return MOON_GOO_ITEMS
\ No newline at end of file
+    return MOON_GOO_ITEMS
+
+def get_type_id_from_name(item_name):
+    return MOON_GOO_TYPE_IDS.get(item_name)
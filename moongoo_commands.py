@@ -1,13 +1,13 @@
 import discord
-import json
 import logging
-import os
 import aiohttp
 from collections import defaultdict
 from datetime import datetime, timedelta
-from config import save_server_structures
+from config import save_server_structures, load_server_structures, load_moon_goo, save_moon_goo
 from structurecommands import get_all_structure_assets, get_moon_drills
-from administration import extract_corporation_id_from_filename, fetch_corporation_name
+from administration import extract_corporation_id_from_filename
+from names import name_resolver
+from registry import registry
 from moongoo import get_moon_goo_items
 
 logging.basicConfig(level=logging.INFO)
@@ -16,77 +16,40 @@ async def save_moon_goo_to_json(moon_drill_assets, server_id):
     try:
         # Convert defaultdict to a regular dictionary
         regular_dict = {k: dict(v) for k, v in moon_drill_assets.items()}
-
-        # Create filename based on server_id
-        filename = f"{server_id}_metenox_goo.json"
-        logging.info(f"Saving moon goo data to JSON: {regular_dict}")
-
-        with open(filename, 'w') as file:
-            json.dump(regular_dict, file, indent=4)
-    except IOError as e:
-        logging.error(f"Error saving moon goo info to JSON file: {e}")
+        logging.info(f"Saving moon goo data: {regular_dict}")
+        save_moon_goo(server_id, regular_dict)
+    except Exception as e:
+        logging.error(f"Error saving moon goo info of server {server_id}: {e}")
 
 async def load_moon_goo_from_json(server_id):
-    filename = f"{server_id}_metenox_goo.json"
     try:
-        if os.path.exists(filename):
-            with open(filename, 'r') as file:
-                data = json.load(file) or {}
-                # Convert loaded data back to a regular dict
-                moon_goo_items = dict(data)
-                logging.info(f"Loaded moon goo data from {filename}: {moon_goo_items}")
-                return moon_goo_items
-        else:
-            logging.warning(f"{filename} not found.")
-            return {}
-    except FileNotFoundError:
-        logging.error(f"File not found: {filename}")
+        moon_goo_items = load_moon_goo(server_id)
+    except ValueError as e:
+        logging.error(f"Error decoding moon goo data of server {server_id}: {e}")
         return {}
-    except json.JSONDecodeError:
-        logging.error(f"Error decoding JSON from file: {filename}")
+
+    if moon_goo_items is None:
+        logging.warning(f"No moon goo data saved for server {server_id}.")
         return {}
-    
-def load_moon_goo_data(server_id):
-    try:
-        # Construct the filename pattern based on server_id
-        filename_pattern = f"{server_id}_*_metenox_goo.json"
-        matching_files = [f for f in os.listdir('.') if f.startswith(f"{server_id}_") and f.endswith("_metenox_goo.json")]
-
-        if not matching_files:
-            logging.warning(f"No moon goo JSON files found for server {server_id}.")
-            return {}
-
-        moon_goo_data = {}
-        for file_name in matching_files:
-            with open(file_name, 'r') as file:
-                data = json.load(file)
-                # Use the file name to determine the station or any other relevant key
-                station_id = file_name.split('_')[1]  # Adjust this split based on your file naming
-                moon_goo_data[station_id] = data
-        
-        logging.info(f"Loaded moon goo data from files: {matching_files}")
-        return moon_goo_data
-    
-    except Exception as e:
-        logging.error(f"Error loading moon goo data: {str(e)}")
-        return {}   
+    logging.info(f"Loaded moon goo data of server {server_id}: {moon_goo_items}")
+    return dict(moon_goo_items)
 
 async def handle_fetch_moon_goo_assets(ctx, structure_name=None):
     server_id = str(ctx.guild.id)
     moon_goo_items = get_moon_goo_items()
     logging.info(f"Loaded moon goo items: {moon_goo_items}")
 
-    # Collect all files for the server (assuming they are stored as {server_id}_{corporation_id}_structures.json)
-    structure_files = [f for f in os.listdir('.') if f.startswith(f"{server_id}_") and f.endswith("_structures.json")]
+    # Corporations of the server with saved structures
+    corporation_ids = registry.structure_corporations(server_id)
 
-    if not structure_files:
-        await ctx.send(f"No structure info files found for server {server_id}.")
+    if not corporation_ids:
+        await ctx.send(f"No structure info found for server {server_id}.")
         return
 
     moon_drill_assets = defaultdict(lambda: defaultdict(int))
 
     async def fetch_and_aggregate_assets(ids, corporation_id, corp_name):
-        all_assets_info = await get_all_structure_assets(ids, server_id)  # Fetch assets for the structure IDs
+        all_assets_info = await get_all_structure_assets(ids, server_id, corporation_id)  # Fetch assets for the structure IDs
         if isinstance(all_assets_info, str):
             await ctx.send(all_assets_info)
             return
@@ -108,21 +71,17 @@ async def handle_fetch_moon_goo_assets(ctx, structure_name=None):
                     # Aggregating by corporation name and structure name
                     moon_drill_assets[f"{corp_name} - {structure_name_in_info}"][item_name] += quantity
 
-    # Loop through each corporation's structure file
-    for structure_file in structure_files:
-        # Extract corporation ID from the file name (assuming format {server_id}_{corporation_id}_structures.json)
-        corporation_id = structure_file.replace(f"{server_id}_", "").replace("_structures.json", "")
+    # Resolve all corporation names in one bulk round trip
+    corp_names = await name_resolver.resolve(corporation_ids)
 
-        # Fetch the corporation's name using the ESI API
-        corp_name = await fetch_corporation_name(corporation_id)
+    # Loop through each corporation's structures
+    for corporation_id in corporation_ids:
+        corp_name = corp_names.get(int(corporation_id), f"Corporation {corporation_id}")
 
         # Load structure info for the corporation
-        try:
-            with open(structure_file, 'r') as file:
-                server_structures = json.load(file)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logging.error(f"Error loading or parsing {structure_file}: {e}")
-            await ctx.send(f"Error reading '{structure_file}'. Please ensure it is correctly formatted.")
+        server_structures = load_server_structures(server_id, corporation_id)
+        if not server_structures:
+            await ctx.send(f"Error reading the structures of corporation {corporation_id}. Please run !updatemoondrills again.")
             continue
 
         # Get all moon drill structure IDs from the configuration
@@ -0,0 +1,153 @@
+import aiohttp
+import asyncio
+import json
+import logging
+import os
+import time
+from config import get_config
+from esi import esi_client
+from storage import write_atomic
+
+logging.basicConfig(level=logging.INFO)
+
+NAMES_FILE = 'names_cache.json'
+BULK_NAMES_URL = 'https://esi.evetech.net/latest/universe/names/'
+BULK_NAMES_LIMIT = 1000  # ESI accepts at most 1000 IDs per /universe/names/ call
+
+class NameResolver:
+    """Persistent ID -> name cache for corporations and structures.
+
+    Public IDs (corporations, characters, alliances, ...) are resolved in bulk
+    through /universe/names/, private structures through the authenticated
+    /universe/structures/{id}/ endpoint with bounded concurrency. Results are
+    kept in names_cache.json and reused until they are older than ttl seconds.
+    """
+
+    def __init__(self, cache_file=NAMES_FILE, ttl=7 * 86400, concurrency=10):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self._names = None
+        # Saves from concurrent resolves share one temp file, so they take turns
+        self._save_lock = asyncio.Lock()
+
+    def _load(self):
+        if self._names is not None:
+            return self._names
+        self._names = {}
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as file:
+                    self._names = json.load(file) or {}
+            except (IOError, json.JSONDecodeError) as e:
+                logging.error(f"Error loading name cache {self.cache_file}: {e}")
+        return self._names
+
+    async def _save(self):
+        async with self._save_lock:
+            # Serialized on the loop so the names cannot change mid-dump, written off it
+            text = json.dumps(self._names)
+            try:
+                await asyncio.to_thread(write_atomic, self.cache_file, text)
+            except IOError as e:
+                logging.error(f"Error saving name cache {self.cache_file}: {e}")
+
+    def _store(self, entity_id, name, category):
+        self._load()[str(entity_id)] = {'name': name, 'category': category, 'resolved_at': time.time()}
+
+    def get_cached(self, entity_id):
+        """Return the cached name for entity_id, or None if unknown or expired."""
+        entry = self._load().get(str(entity_id))
+        if entry and time.time() - entry['resolved_at'] < self.ttl:
+            return entry['name']
+        return None
+
+    async def _post_names(self, ids):
+        async with esi_client.post(BULK_NAMES_URL, json=ids, params={'datasource': 'tranquility'}) as response:
+            if response.status == 404 and len(ids) > 1:
+                # One invalid ID fails the whole batch: split it and retry both halves
+                middle = len(ids) // 2
+                first, second = await asyncio.gather(self._post_names(ids[:middle]), self._post_names(ids[middle:]))
+                return first + second
+            if response.status == 404:
+                logging.warning(f"ESI could not resolve a name for ID {ids[0]}.")
+                return []
+            response.raise_for_status()
+            return await response.json()
+
+    async def resolve(self, ids):
+        """Resolve public IDs to names, using at most one bulk ESI call per 1000 unknown IDs.
+
+        Returns {int(id): name} for every ID that could be resolved.
+        """
+        ids = {int(entity_id) for entity_id in ids}
+        names = {}
+        unknown = []
+        for entity_id in ids:
+            name = self.get_cached(entity_id)
+            if name is None:
+                unknown.append(entity_id)
+            else:
+                names[entity_id] = name
+
+        if unknown:
+            try:
+                for i in range(0, len(unknown), BULK_NAMES_LIMIT):
+                    for entry in await self._post_names(unknown[i:i + BULK_NAMES_LIMIT]):
+                        self._store(entry['id'], entry['name'], entry.get('category'))
+                        names[entry['id']] = entry['name']
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.error(f"Failed to resolve names for {len(unknown)} IDs: {e}")
+            await self._save()
+
+        return names
+
+    async def _fetch_structure_name(self, structure_id, headers, semaphore):
+        url = f'https://esi.evetech.net/latest/universe/structures/{structure_id}/'
+        async with semaphore:
+            try:
+                data, _ = await esi_client.get_json(url, headers=headers)
+            except aiohttp.ClientError as e:
+                logging.error(f"Request error for structure ID {structure_id}: {e}")
+                return structure_id, None
+            except asyncio.TimeoutError:
+                logging.error(f"Request for structure ID {structure_id} timed out")
+                return structure_id, None
+
+        if 'name' not in data:
+            logging.error(f"Unexpected response format for structure ID {structure_id}: {data}")
+            return structure_id, None
+        return structure_id, data['name']
+
+    async def resolve_structures(self, structure_ids, headers, concurrency=None, refresh=False):
+        """Resolve private structure IDs with the given (authenticated) headers.
+
+        Cached names are returned without a request unless refresh is set;
+        the rest are fetched concurrently, at most `concurrency` at a time.
+        Returns {int(id): name} for every structure that could be resolved.
+        """
+        names = {}
+        unknown = []
+        for structure_id in {int(structure_id) for structure_id in structure_ids}:
+            name = None if refresh else self.get_cached(structure_id)
+            if name is None:
+                unknown.append(structure_id)
+            else:
+                names[structure_id] = name
+
+        if unknown:
+            semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+            results = await asyncio.gather(*(self._fetch_structure_name(structure_id, headers, semaphore) for structure_id in unknown))
+            for structure_id, name in results:
+                if name is not None:
+                    self._store(structure_id, name, 'structure')
+                    names[structure_id] = name
+            await self._save()
+
+        return names
+
+
+name_resolver = NameResolver(
+    ttl=get_config('name_cache_ttl', 7 * 86400),
+    concurrency=get_config('name_resolve_concurrency', 10)
+)
@@ -0,0 +1,180 @@
+import logging
+import math
+import os
+import struct
+import time
+from array import array
+from collections import deque
+from config import get_config
+
+logging.basicConfig(level=logging.INFO)
+
+HISTORY_DIR = 'price_history'
+# One sample per refresh: unix timestamp, buy price, sell price as little-endian doubles
+SAMPLE_FORMAT = '<ddd'
+SAMPLE_SIZE = struct.calcsize(SAMPLE_FORMAT)
+
+class RollingWindow:
+    """Time-weighted average price and volatility over a sliding time window.
+
+    Each price is weighted by how long it was in effect (until the next
+    sample). Sums are updated on every append and reduced when segments fall
+    out of the window, so reading the TWAP or volatility never walks the
+    history.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._segments = deque()  # (end_time, weighted_price, duration, log_return)
+        self._last = None
+        self._weighted_sum = 0.0
+        self._duration_sum = 0.0
+        self._return_sum = 0.0
+        self._return_sq_sum = 0.0
+        self._return_count = 0
+
+    def add(self, timestamp, price):
+        if self._last is not None:
+            last_time, last_price = self._last
+            duration = timestamp - last_time
+            if duration <= 0:
+                # Same timestamp twice: keep the newer price, nothing to weight yet
+                self._last = (last_time, price)
+                return
+            log_return = math.log(price / last_price) if price > 0 and last_price > 0 else None
+            self._segments.append((timestamp, last_price * duration, duration, log_return))
+            self._weighted_sum += last_price * duration
+            self._duration_sum += duration
+            if log_return is not None:
+                self._return_sum += log_return
+                self._return_sq_sum += log_return * log_return
+                self._return_count += 1
+        self._last = (timestamp, price)
+        self._evict(timestamp - self.window)
+
+    def _evict(self, cutoff):
+        while self._segments and self._segments[0][0] <= cutoff:
+            _, weighted, duration, log_return = self._segments.popleft()
+            self._weighted_sum -= weighted
+            self._duration_sum -= duration
+            if log_return is not None:
+                self._return_sum -= log_return
+                self._return_sq_sum -= log_return * log_return
+                self._return_count -= 1
+
+    def twap(self):
+        if self._duration_sum > 0:
+            return self._weighted_sum / self._duration_sum
+        return self._last[1] if self._last else None
+
+    def volatility(self):
+        """Sample standard deviation of the log returns between refreshes in the window."""
+        n = self._return_count
+        if n < 2:
+            return 0.0
+        variance = (self._return_sq_sum - self._return_sum * self._return_sum / n) / (n - 1)
+        return math.sqrt(max(variance, 0.0))
+
+
+class PriceSeries:
+    """Full price history of one type, array-backed, plus rolling buy/sell windows."""
+
+    def __init__(self, window):
+        self.timestamps = array('d')
+        self.buy = array('d')
+        self.sell = array('d')
+        self.buy_window = RollingWindow(window)
+        self.sell_window = RollingWindow(window)
+
+    def append(self, timestamp, buy, sell):
+        self.timestamps.append(timestamp)
+        self.buy.append(buy)
+        self.sell.append(sell)
+        self.buy_window.add(timestamp, buy)
+        self.sell_window.add(timestamp, sell)
+
+
+class PriceHistory:
+    """Append-only per-type price history stored as compact binary files.
+
+    Every market refresh appends one 24 byte sample per item to
+    price_history/<type_id>.bin. On startup the files are read back into
+    arrays and the rolling windows are rebuilt from the samples inside the
+    window only.
+    """
+
+    def __init__(self, directory=HISTORY_DIR, window=7 * 86400):
+        self.directory = directory
+        self.window = window
+        self._series = None
+
+    def _path(self, type_id):
+        return os.path.join(self.directory, f"{int(type_id)}.bin")
+
+    def _load(self):
+        if self._series is not None:
+            return self._series
+        self._series = {}
+        if not os.path.isdir(self.directory):
+            return self._series
+
+        cutoff = time.time() - self.window
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.bin'):
+                continue
+            type_id = int(filename[:-4])
+            samples = array('d')
+            try:
+                with open(os.path.join(self.directory, filename), 'rb') as file:
+                    data = file.read()
+                # Drop a partially written trailing sample
+                samples.frombytes(data[:len(data) - len(data) % SAMPLE_SIZE])
+            except IOError as e:
+                logging.error(f"Error loading price history {filename}: {e}")
+                continue
+
+            series = PriceSeries(self.window)
+            series.timestamps = samples[0::3]
+            series.buy = samples[1::3]
+            series.sell = samples[2::3]
+            for timestamp, buy, sell in zip(series.timestamps, series.buy, series.sell):
+                if timestamp >= cutoff:
+                    series.buy_window.add(timestamp, buy)
+                    series.sell_window.add(timestamp, sell)
+            self._series[type_id] = series
+        return self._series
+
+    def append(self, type_id, timestamp, buy, sell):
+        type_id = int(type_id)
+        series = self._load().get(type_id)
+        if series is None:
+            series = self._series[type_id] = PriceSeries(self.window)
+        series.append(timestamp, buy, sell)
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(type_id), 'ab') as file:
+                file.write(struct.pack(SAMPLE_FORMAT, timestamp, buy, sell))
+        except IOError as e:
+            logging.error(f"Error appending price history for type {type_id}: {e}")
+
+    def record(self, market_stats, timestamp=None):
+        """Append the buy/sell prices of a refresh ({type_id: stats}) to the history."""
+        timestamp = timestamp or time.time()
+        for type_id, stats in market_stats.items():
+            self.append(type_id, timestamp, stats.get('buyAvgFivePercent') or 0, stats.get('sellAvgFivePercent') or 0)
+
+    def smoothed(self, type_id):
+        """Return {'buyTwap', 'sellTwap', 'buyVolatility', 'sellVolatility'} for a type, or {} if unknown."""
+        series = self._load().get(int(type_id))
+        if series is None:
+            return {}
+        return {
+            'buyTwap': series.buy_window.twap(),
+            'sellTwap': series.sell_window.twap(),
+            'buyVolatility': series.buy_window.volatility(),
+            'sellVolatility': series.sell_window.volatility()
+        }
+
+
+price_history = PriceHistory(window=get_config('price_history_window_days', 7) * 86400)
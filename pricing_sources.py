@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import aiohttp
+from datetime import datetime
+from esi import esi_client
+from config import get_config
+
+logging.basicConfig(level=logging.INFO)
+
+# Trade hubs a price can be requested for: region and main station
+HUBS = {
+    'jita': {'region_id': 10000002, 'station_id': 60003760},
+    'amarr': {'region_id': 10000043, 'station_id': 60008494},
+    'dodixie': {'region_id': 10000032, 'station_id': 60011866}
+}
+
+EVETYCOON_BASE_URL = "https://evetycoon.com/api"
+JANICE_BASE_URL = "https://janice.e-351.com/api/rest/v2"
+# Janice market IDs of the hub stations
+JANICE_MARKETS = {'jita': 2, 'amarr': 115, 'dodixie': 117}
+
+
+def now_timestamp():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class PriceSource:
+    """Base class of a market price API.
+
+    fetch() returns the stats of one item at one hub in the market_stats.json
+    schema (buyVolume, sellVolume, buyOrders, sellOrders, buyAvgFivePercent,
+    sellAvgFivePercent, fetchedAt, source) or None if the source failed.
+    """
+
+    name = None
+
+    def __init__(self, base_url, timeout=15):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def supports(self, hub):
+        return hub in HUBS
+
+    async def fetch(self, type_id, hub):
+        raise NotImplementedError
+
+    async def _get_json(self, url, params=None, headers=None):
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        try:
+            async with esi_client.get(url, params=params, headers=headers, timeout=timeout) as response:
+                if response.status != 200:
+                    logging.error(f"{self.name}: failed to fetch {url}: {response.status}")
+                    return None
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logging.error(f"{self.name}: failed to fetch {url}: {e!r}")
+            return None
+
+
+class EveTycoonSource(PriceSource):
+    """evetycoon.com region stats, restricted to the hub station."""
+
+    name = 'evetycoon'
+
+    async def fetch(self, type_id, hub):
+        hub_info = HUBS[hub]
+        url = f"{self.base_url}/v1/market/stats/{hub_info['region_id']}/{type_id}"
+        data = await self._get_json(url, params={'locationId': hub_info['station_id']})
+        if data is None:
+            return None
+        try:
+            return {
+                "buyVolume": data["buyVolume"],
+                "sellVolume": data["sellVolume"],
+                "buyOrders": data["buyOrders"],
+                "sellOrders": data["sellOrders"],
+                "buyAvgFivePercent": data["buyAvgFivePercent"],
+                "sellAvgFivePercent": data["sellAvgFivePercent"],
+                "fetchedAt": now_timestamp(),
+                "source": self.name
+            }
+        except KeyError as e:
+            logging.error(f"{self.name}: unexpected response for type {type_id}: missing {e}")
+            return None
+
+
+class JaniceSource(PriceSource):
+    """Janice appraisal API (needs janice_api_key)."""
+
+    name = 'janice'
+
+    def __init__(self, base_url, api_key, timeout=15, markets=None):
+        super().__init__(base_url, timeout)
+        self.api_key = api_key
+        self.markets = markets or JANICE_MARKETS
+
+    def supports(self, hub):
+        return bool(self.api_key) and hub in self.markets
+
+    async def fetch(self, type_id, hub):
+        url = f"{self.base_url}/pricer/{type_id}"
+        data = await self._get_json(url, params={'market': self.markets[hub]}, headers={'X-ApiKey': self.api_key})
+        if data is None:
+            return None
+        try:
+            top5 = data["top5AveragePrices"]
+            return {
+                "buyVolume": data["buyVolume"],
+                "sellVolume": data["sellVolume"],
+                "buyOrders": data["buyOrderCount"],
+                "sellOrders": data["sellOrderCount"],
+                "buyAvgFivePercent": top5["buyPrice"],
+                "sellAvgFivePercent": top5["sellPrice"],
+                "fetchedAt": now_timestamp(),
+                "source": self.name
+            }
+        except (KeyError, TypeError) as e:
+            logging.error(f"{self.name}: unexpected response for type {type_id}: {e!r}")
+            return None
+
+
+def build_price_sources():
+    """Create the sources listed in price_sources, in priority order."""
+    timeout = get_config('market_fetch_timeout', 15)
+    available = {
+        'evetycoon': lambda: EveTycoonSource(get_config('evetycoon_base_url', EVETYCOON_BASE_URL), timeout),
+        'janice': lambda: JaniceSource(get_config('janice_base_url', JANICE_BASE_URL), get_config('janice_api_key', ''), timeout)
+    }
+
+    sources = []
+    for name in get_config('price_sources', ['evetycoon', 'janice']):
+        if name not in available:
+            logging.warning(f"Unknown price source '{name}' in config, ignoring it.")
+            continue
+        sources.append(available[name]())
+    return sources
+
+
+async def fetch_hub_stats(sources, type_id, hub):
+    """Ask each source in order until one returns stats for the item at the hub."""
+    for source in sources:
+        if not source.supports(hub):
+            continue
+        stats = await source.fetch(type_id, hub)
+        if stats is not None:
+            return stats
+    return None
@@ -0,0 +1,91 @@
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+class GuildRegistry:
+    """In-memory index of which guilds and corporations have stored state.
+
+    The storage backend is listed once, on first use. After that every
+    save function reports what it writes (add), so lookups such
+    as "which corporations does this server have" are dict reads instead of
+    os.listdir() calls or queries that grow with the number of guilds.
+
+    Layout: server_id -> corporation_id -> set of kinds ('token', 'structures').
+    Goo snapshots are listed by the storage too but nothing looks them up here.
+    """
+
+    def __init__(self, source=None):
+        # Callable yielding (kind, server_id, corporation_id), set by config to the storage backend
+        self.source = source
+        self._servers = {}
+        self._loaded = False
+        # save_token is also called from the Flask thread
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                entries = list(self.source()) if self.source else []
+            except Exception as e:
+                logging.error(f"Error listing stored guild state: {e}")
+                entries = []
+            for kind, server_id, corporation_id in entries:
+                self._index(kind, server_id, corporation_id)
+            self._loaded = True
+            logging.info(f"Guild registry loaded: {len(self._servers)} servers, {sum(len(corps) for corps in self._servers.values())} corporations.")
+
+    def _index(self, kind, server_id, corporation_id):
+        if kind != 'goo':
+            self._servers.setdefault(str(server_id), {}).setdefault(str(corporation_id), set()).add(kind)
+
+    def add(self, kind, server_id, corporation_id):
+        """Record state that was just saved (kind is token or structures)."""
+        self._ensure_loaded()
+        with self._lock:
+            self._index(kind, server_id, corporation_id)
+
+    def _corporations_with(self, server_id, kind):
+        self._ensure_loaded()
+        with self._lock:
+            corporations = self._servers.get(str(server_id), {})
+            return [corporation_id for corporation_id, entry in corporations.items() if kind in entry]
+
+    def token_corporations(self, server_id):
+        """Corporation IDs of a server that have a token, in storage order."""
+        return self._corporations_with(server_id, 'token')
+
+    def structure_corporations(self, server_id):
+        """Corporation IDs of a server that have saved structures."""
+        return self._corporations_with(server_id, 'structures')
+
+    def first_corporation(self, server_id):
+        corporations = self.token_corporations(server_id)
+        return corporations[0] if corporations else None
+
+    def server_ids(self):
+        """Servers with at least one token."""
+        self._ensure_loaded()
+        with self._lock:
+            return [server_id for server_id, corporations in self._servers.items() if any('token' in entry for entry in corporations.values())]
+
+    def token_targets(self):
+        """All (server_id, corporation_id) pairs with a token."""
+        self._ensure_loaded()
+        with self._lock:
+            return [(server_id, corporation_id) for server_id, corporations in self._servers.items()
+                    for corporation_id, entry in corporations.items() if 'token' in entry]
+
+    def structure_targets(self):
+        """All (server_id, corporation_id) pairs with saved structures."""
+        self._ensure_loaded()
+        with self._lock:
+            return [(server_id, corporation_id) for server_id, corporations in self._servers.items()
+                    for corporation_id, entry in corporations.items() if 'structures' in entry]
+
+
+registry = GuildRegistry()
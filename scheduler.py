@@ -1,143 +1,298 @@
 import asyncio
-from datetime import datetime, timedelta
-import json
-import os
+import heapq
+import time
 import logging
 import aiohttp
-from administration import get_access_token, extract_corporation_id_from_filename
+import discord
+from administration import extract_corporation_id_from_filename
+from assets import asset_snapshots
+from forecast import DrillLevels, get_server_thresholds, FUEL_BLOCK_TYPE_IDS, MIN_CHECK_INTERVAL
+from alert_state import alert_state
+from alert_digest import AlertDigest
+from registry import registry
 import config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-# File to store alert channels
-ALERT_CHANNELS_FILE = 'alert_channels.json'
-
-# Dictionary to track the last alert time for each structure
-last_alert_times = {
-    'magmatic_gas': {},
-    'fuel_blocks': {}
-}
-
-async def run_alert_scheduler(bot, server_id):
-    logging.info(f"Starting alert scheduler for server {server_id}")
-    while True:
-        alert_channels = config.load_alert_channels()
-        alert_channel_id = alert_channels.get(server_id)
+def list_alert_targets():
+    """Return every (server_id, corporation_id) pair that has saved structures."""
+    return set(registry.structure_targets())
+
+
+class AlertScheduler:
+    """One scheduler for the gas/fuel alerts of every guild and corporation.
+
+    Keeps a heap of (next check time, (server_id, corporation_id)) and sleeps
+    until the earliest deadline (or until schedule() wakes it up). Due checks
+    are handed to a fixed pool of workers, so the number of guilds only grows
+    the heap, not the number of running tasks. A target is never checked by
+    two workers at once.
+
+    Deadlines are persisted in the alert state, so after a restart every
+    target resumes at its stored next check instead of all being checked at
+    once.
+
+    Alerts are collected per channel for digest_delay seconds, so all
+    corporations of a guild checked in the same sweep share one digest. A
+    digest is sent once the delay has passed and the last check adding to
+    it has finished, so slow asset fetches never add to a sent digest.
+    """
+
+    def __init__(self, check_interval=3600, workers=8, discovery_interval=600, digest_delay=10):
+        self.check_interval = check_interval
+        self.workers = workers
+        self.discovery_interval = discovery_interval
+        self.digest_delay = digest_delay
+        self._digests = {}  # channel id -> AlertDigest waiting to be sent
+        self._digest_checks = {}  # channel id -> number of checks still adding to its digest
+        self._digests_due = set()  # channel ids whose digest_delay has passed
+        self._digest_targets = {}  # channel id -> targets whose checks added to its digest
+        self.bot = None
+        self._heap = []
+        self._deadlines = {}  # target -> current deadline, older heap entries are skipped
+        self._active = set()
+        self._recheck = set()
+        self._targets = set()
+        self._queue = None
+        self._wake = None
+        self._tasks = []
+        self._next_discovery = 0
+
+    def start(self, bot):
+        """Start the dispatcher and worker tasks on the running loop. Safe to call more than once."""
+        if self._tasks:
+            return
+        self.bot = bot
+        alert_state.load()
+        self._queue = asyncio.Queue()
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._dispatch(), name="alert_scheduler")]
+        self._tasks += [asyncio.create_task(self._worker(), name=f"alert_worker_{i}") for i in range(self.workers)]
+        logging.info(f"Alert scheduler started with {self.workers} workers.")
+
+    def schedule(self, target, when=None):
+        """Check target at `when` (unix time, default now) unless it is already due earlier."""
+        when = time.time() if when is None else when
+        current = self._deadlines.get(target)
+        if current is not None and current <= when:
+            return
+        self._deadlines[target] = when
+        alert_state.set_next_check(*target, when)
+        heapq.heappush(self._heap, (when, target))
+        if self._wake is not None:
+            self._wake.set()
+
+    def schedule_server(self, server_id, when=None):
+        """Check every corporation of a server, e.g. after its alert channel changed."""
+        server_id = str(server_id)
+        self._targets |= {target for target in list_alert_targets() if target[0] == server_id}
+        for target in self._targets:
+            if target[0] == server_id:
+                self.schedule(target, when)
+
+    def _discover(self):
+        """Pick up new corporations and forget removed ones."""
+        targets = list_alert_targets()
+        for target in targets - self._targets:
+            self.schedule(target, alert_state.next_check(*target))
+        for target in self._targets - targets:
+            self._deadlines.pop(target, None)
+            alert_state.forget(*target)
+        self._targets = targets
+        self._next_discovery = time.time() + self.discovery_interval
+
+    async def _dispatch(self):
+        while True:
+            now = time.time()
+            if now >= self._next_discovery:
+                self._discover()
+
+            while self._heap and self._heap[0][0] <= now:
+                when, target = heapq.heappop(self._heap)
+                if self._deadlines.get(target) != when:
+                    continue
+                del self._deadlines[target]
+                if target in self._active:
+                    self._recheck.add(target)
+                    continue
+                self._active.add(target)
+                self._queue.put_nowait(target)
+
+            next_wakeup = min(self._heap[0][0], self._next_discovery) if self._heap else self._next_discovery
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0, next_wakeup - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            target = await self._queue.get()
+            next_check = None
+            try:
+                next_check = await self.check(*target)
+            except Exception as e:
+                logging.error(f"Alert check failed for server {target[0]} corporation {target[1]}: {e}")
+            finally:
+                self._active.discard(target)
+                self._queue.task_done()
+
+            if target not in self._targets:
+                continue
+            if target in self._recheck:
+                self._recheck.discard(target)
+                self.schedule(target)
+            self.schedule(target, next_check or time.time() + self.check_interval)
+
+    async def check(self, server_id, corporation_id):
+        """Run the alert check of one corporation. Returns the next check time or None for the default interval."""
+        alert_channel_id = config.get_alert_channel(server_id)
         if not alert_channel_id:
-            await asyncio.sleep(3600)  # Sleep for an hour if no alert channel is set
-            continue
-
-        alert_channel = bot.get_channel(int(alert_channel_id))
-        if alert_channel:
-            await check_gas_and_send_alerts(alert_channel, server_id)
+            return None
+
+        alert_channel = self.bot.get_channel(int(alert_channel_id))
+        if alert_channel is None:
+            logging.debug(f"Alert channel {alert_channel_id} of server {server_id} not found.")
+            return None
+
+        channel_id = alert_channel.id
+        digest = self._digests.get(channel_id)
+        if digest is None:
+            digest = self._digests[channel_id] = AlertDigest()
+            self._digest_checks[channel_id] = 0
+            self._digest_targets[channel_id] = set()
+            asyncio.create_task(self._digest_timer(alert_channel))
+
+        self._digest_checks[channel_id] += 1
+        self._digest_targets[channel_id].add((server_id, corporation_id))
+        try:
+            return await check_gas_and_send_alerts(alert_channel, server_id, corporation_id, digest)
+        finally:
+            self._digest_checks[channel_id] -= 1
+            if self._digest_checks[channel_id] == 0 and channel_id in self._digests_due:
+                await self._flush_digest(alert_channel)
+
+    async def _digest_timer(self, alert_channel):
+        await asyncio.sleep(self.digest_delay)
+        self._digests_due.add(alert_channel.id)
+        # Otherwise the last running check sends it when it finishes
+        if self._digest_checks.get(alert_channel.id) == 0:
+            await self._flush_digest(alert_channel)
+
+    async def _flush_digest(self, alert_channel):
+        # Taken out before sending, so checks starting meanwhile begin a new digest
+        digest = self._digests.pop(alert_channel.id)
+        del self._digest_checks[alert_channel.id]
+        self._digests_due.discard(alert_channel.id)
+        targets = self._digest_targets.pop(alert_channel.id)
+        if not await send_alert_digest(alert_channel, digest) and digest.alert_keys:
+            # The alerts were not recorded, check again soon instead of at the next crossing (which
+            # is hours away, or never for drills already below their lowest threshold)
+            retry_at = time.time() + config.get_config('alert_min_check_interval', MIN_CHECK_INTERVAL)
+            for target in targets:
+                self.schedule(target, retry_at)
+
+
+async def send_alert_digest(alert_channel, digest):
+    """Send a digest and remember its alerts as sent. Returns False if sending failed (nothing is recorded)."""
+    try:
+        await digest.send(alert_channel)
+    except discord.HTTPException as e:
+        logging.error(f"Failed to send alert digest to channel {alert_channel.id}: {e}")
+        return False
+    for key in digest.alert_keys:
+        alert_state.record_alert(*key)
+    return True
 
-        await asyncio.sleep(3600)  # Check every hour
 
 # Function to check gas and send alerts for a specific server
-async def check_gas_and_send_alerts(alert_channel, server_id):
-    # Dynamically determine the corporation_id and structure file
-    corporation_id = extract_corporation_id_from_filename(server_id)
+async def check_gas_and_send_alerts(alert_channel, server_id, corporation_id=None, digest=None):
+    """Check one corporation's drills and add due alerts to digest (sent right away if no digest is given)."""
+    if digest is None:
+        digest = AlertDigest()
+        try:
+            return await check_gas_and_send_alerts(alert_channel, server_id, corporation_id, digest)
+        finally:
+            await send_alert_digest(alert_channel, digest)
+
+    # Dynamically determine the corporation_id
+    if not corporation_id:
+        corporation_id = extract_corporation_id_from_filename(server_id)
     if not corporation_id:
         logging.error(f"Could not determine corporation ID for server {server_id}.")
         return
 
-    structure_file = f"{server_id}_{corporation_id}_structures.json"
-    
-    if not os.path.exists(structure_file):
-        logging.error(f"Structure file {structure_file} not found.")
-        return
-
-    with open(structure_file, 'r') as file:
-        structure_info = json.load(file)
+    server_structures = config.load_server_structures(server_id, corporation_id)
 
-    moon_drill_ids = config.get_config('metenox_moon_drill_ids', server_id)
+    structure_info = server_structures.get('structure_info', {})
+    moon_drill_ids = server_structures.get('metenox_moon_drill_ids', [])
+    if not moon_drill_ids:
+        return
     
     try:
-        all_assets_info = await get_all_structure_assets_for_server(moon_drill_ids, server_id)
+        all_assets_info = await get_all_structure_assets_for_server(moon_drill_ids, server_id, corporation_id)
     except Exception as e:
         logging.error(f"Error getting assets info: {e}")
-        await alert_channel.send("Failed to retrieve structure assets.")
+        digest.add_line("Failed to retrieve structure assets.")
         return
 
     if isinstance(all_assets_info, str):
-        await alert_channel.send(all_assets_info)
+        digest.add_line(all_assets_info)
         return
 
-    current_time = datetime.utcnow()
+    now = time.time()
+    snapshot = asset_snapshots.latest(server_id, corporation_id)
+    # Project from when ESI generated the amounts, not from when they were downloaded
+    observed_at = snapshot.observed_at if snapshot is not None else now
+    thresholds = get_server_thresholds(server_id)
+    levels = DrillLevels()
 
     for structure_id, assets_info in all_assets_info.items():
-        structure_name = structure_info.get(structure_id, 'Unknown Structure')
-        asset_totals = {'Magmatic Gas': 0, 'Fuel Blocks': 0}
-
-        for asset in assets_info:
-            type_id = asset.get('type_id')
-            quantity = asset.get('quantity')
-            if type_id == 81143:  # Magmatic Gas
-                asset_totals['Magmatic Gas'] += quantity
-            elif type_id == 4312:  # Fuel Blocks
-                asset_totals['Fuel Blocks'] += quantity
-
-        magmatic_gas_amount = asset_totals['Magmatic Gas']
-        fuel_blocks_amount = asset_totals['Fuel Blocks']
-
-        magmatic_gas_depletion_time, magmatic_gas_days, magmatic_gas_hours = calculate_depletion_time(magmatic_gas_amount, 150)
-        fuel_blocks_depletion_time, fuel_blocks_days, fuel_blocks_hours = calculate_depletion_time(fuel_blocks_amount, 5)
+        structure_name = structure_info.get(str(structure_id), 'Unknown Structure')
+        gas = sum(asset.get('quantity', 0) for asset in assets_info if asset.get('type_id') == 81143)  # Magmatic Gas
+        fuel = sum(asset.get('quantity', 0) for asset in assets_info if asset.get('type_id') in FUEL_BLOCK_TYPE_IDS)
+        levels.add(server_id, corporation_id, structure_id, structure_name, gas, fuel, observed_at, thresholds)
+
+    # One pass over all drills, only crossed thresholds come back
+    evaluation = levels.evaluate(now)
+    for row, alert_type, level_hours, remaining_hours, amount in evaluation.alerts():
+        # An empty bay (or one ESI did not list) never alerted before, only a running drill does
+        if amount <= 0:
+            continue
+        handle_alerts(digest, server_id, levels.structure_ids[row], levels.structure_names[row], alert_type, level_hours, remaining_hours, amount, now)
 
-        # Use helper function for alerts
-        await handle_alerts(alert_channel, structure_name, 'magmatic_gas', magmatic_gas_days, magmatic_gas_hours, magmatic_gas_amount, current_time)
-        await handle_alerts(alert_channel, structure_name, 'fuel_blocks', fuel_blocks_days, fuel_blocks_hours, fuel_blocks_amount, current_time)
+    # Come back when the next drill crosses an alert threshold
+    return evaluation.next_check()
 
 
-async def handle_alerts(alert_channel, structure_name, alert_type, days, hours, amount, current_time):
-    if days < 2 or (days == 1 and hours < 24):
-        if structure_name not in last_alert_times[alert_type]:
-            last_alert_times[alert_type][structure_name] = {
-                '48h': None,
-                '24h': None
-            }
+def handle_alerts(digest, server_id, structure_id, structure_name, alert_type, level_hours, remaining_hours, amount, now):
+    level = f"{level_hours:g}h"
 
-        # Check 48h alert
-        if days == 2 and (last_alert_times[alert_type][structure_name]['48h'] is None or 
-                          current_time - last_alert_times[alert_type][structure_name]['48h'] >= timedelta(days=1)):
-            await alert_channel.send(f"**{structure_name}**: {alert_type.replace('_', ' ').title()} is running low!\n{alert_type.replace('_', ' ').title()}: ***{amount}***\nRuns out in: {days} Days {hours} Hours")
-            last_alert_times[alert_type][structure_name]['48h'] = current_time
+    # Repeat an alert of the same level at most once a day, also across restarts
+    last_alert = alert_state.last_alert(server_id, structure_id, alert_type, level)
+    if last_alert is not None and now - last_alert < 86400:
+        return
 
-        # Check 24h alert
-        elif days == 1 and (last_alert_times[alert_type][structure_name]['24h'] is None or 
-                            current_time - last_alert_times[alert_type][structure_name]['24h'] >= timedelta(days=1)):
-            await alert_channel.send(f"**{structure_name}**: {alert_type.replace('_', ' ').title()} is running low!\n{alert_type.replace('_', ' ').title()}: ***{amount}***\nRuns out in: {days} Days {hours} Hours")
-            last_alert_times[alert_type][structure_name]['24h'] = current_time
+    days, hours = divmod(int(remaining_hours), 24)
+    digest.add_alert(structure_name, alert_type, amount, days, hours, key=(server_id, structure_id, alert_type, level))
 
 
 # Helper function for structure alerts
-async def get_all_structure_assets_for_server(structure_ids, server_id):
-    corporation_id = extract_corporation_id_from_filename(server_id)
+async def get_all_structure_assets_for_server(structure_ids, server_id, corporation_id=None):
+    if not corporation_id:
+        corporation_id = extract_corporation_id_from_filename(server_id)
     if not corporation_id:
         return 'Failed to get corporation ID'
 
-    access_token = get_access_token(server_id, corporation_id)
-    if not access_token:
-        return 'Failed to get access token'
-
-    headers = {'Authorization': f'Bearer {access_token}'}
-    url = f'https://esi.evetech.net/latest/corporations/{corporation_id}/assets/?datasource=tranquility'
-
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                data = await response.json()
-
-        if 'error' in data:
-            return f"Error fetching structure assets: {data['error']}"
+        snapshot = await asset_snapshots.get(server_id, corporation_id)
 
-        all_assets = {}
-        for structure_id in structure_ids:
-            assets = [asset for asset in data if asset.get('location_id') == structure_id and asset.get('location_flag') == 'StructureFuel']
-            if assets:
-                all_assets[structure_id] = assets
+        return snapshot.group(structure_ids, flags={'StructureFuel'})
 
-        return all_assets
+    except ValueError as e:
+        logging.error(str(e))
+        return str(e)
 
     except aiohttp.ClientError as e:
         logging.error(f"HTTP Client Error: {e}")
@@ -147,16 +302,10 @@ async def get_all_structure_assets_for_server(structure_ids, server_id):
         logging.error(f"Unexpected error: {e}")
         return "An unexpected error occurred."
 
-# Function to calculate depletion time
-def calculate_depletion_time(amount, rate_per_hour):
-    if amount <= 0 or rate_per_hour <= 0:
-        return "Unknown", 0, 0
-
-    depletion_hours = amount / rate_per_hour
-    depletion_time = datetime.utcnow() + timedelta(hours=depletion_hours)
-    remaining_time = depletion_time - datetime.utcnow()
-
-    days, remainder = divmod(remaining_time.total_seconds(), 86400)
-    hours, _ = divmod(remainder, 3600)
 
-    return depletion_time, int(days), int(hours)
\ No newline at end of file
+alert_scheduler = AlertScheduler(
+    check_interval=config.get_config('alert_check_interval', 3600),
+    workers=config.get_config('alert_workers', 8),
+    discovery_interval=config.get_config('alert_discovery_interval', 600),
+    digest_delay=config.get_config('alert_digest_delay', 10)
+)
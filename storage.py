@@ -0,0 +1,357 @@
+import argparse
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logging.basicConfig(level=logging.INFO)
+
+TOKEN_FIELDS = ('access_token', 'refresh_token', 'expires_in', 'created_at', 'character_id')
+STRUCTURE_KEYS = ('structure_info', 'metenox_moon_drill_ids')
+_MISSING = object()
+
+
+def write_atomic(path, text):
+    """Replace path with text so readers see either the old or the new file, never a partial one."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+class JsonStorage:
+    """The original layout: {server}_{corp}_token.json, {server}_{corp}_structures.json,
+    {server}_metenox_goo.json and one alert_channels.json.
+
+    Saves are write-behind: the serialized data is kept in memory and a
+    timer flushes it flush_delay seconds after the first unflushed save, so
+    a burst of saves to one file costs one write. Loads see pending data
+    first, and every file is replaced through a temp file and os.replace.
+    """
+
+    def __init__(self, directory='.', alert_channel_file='alert_channels.json', flush_delay=1.0):
+        self.directory = directory
+        self.alert_channel_file = os.path.join(directory, alert_channel_file)
+        self.flush_delay = flush_delay
+        self._pending = {}  # path -> serialized JSON
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def token_path(self, server_id, corporation_id):
+        return self._path(f"{server_id}_{corporation_id}_token.json")
+
+    def structures_path(self, server_id, corporation_id):
+        return self._path(f"{server_id}_{corporation_id}_structures.json")
+
+    def goo_path(self, server_id):
+        return self._path(f"{server_id}_metenox_goo.json")
+
+    def list_entries(self):
+        """Yield (kind, server_id, corporation_id) for every stored item; kind is token, structures or goo."""
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.endswith('_metenox_goo.json'):
+                yield 'goo', filename.split('_')[0], None
+                continue
+            for kind, suffix in (('token', '_token.json'), ('structures', '_structures.json')):
+                if filename.endswith(suffix):
+                    parts = filename[:-len(suffix)].split('_')
+                    if len(parts) == 2 and all(parts):
+                        yield kind, parts[0], parts[1]
+                    break
+
+    def _read(self, path):
+        """Return the parsed file or None if it does not exist. Raises ValueError on invalid JSON."""
+        with self._lock:
+            text = self._pending.get(path, _MISSING)
+        if text is _MISSING:
+            if not os.path.exists(path):
+                return None
+            with open(path, 'r') as file:
+                text = file.read()
+        text = text.strip()
+        return json.loads(text) if text else {}
+
+    def _write(self, path, data):
+        # Serialize now so later changes to data by the caller are not saved
+        self._schedule(path, json.dumps(data, indent=4))
+
+    def _schedule(self, path, text):
+        with self._lock:
+            self._pending[path] = text
+            if self.flush_delay > 0:
+                self._arm_timer()
+                return
+        self.flush()
+
+    def _arm_timer(self):
+        # Called with self._lock held
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write every pending save to disk now."""
+        with self._flush_lock:
+            with self._lock:
+                self._timer = None
+                pending = dict(self._pending)
+            for path, text in pending.items():
+                try:
+                    write_atomic(path, text)
+                except OSError as e:
+                    # Stays pending and is retried by the next flush
+                    logging.error(f"Error writing {path}: {e}")
+                    continue
+                with self._lock:
+                    # A newer save that arrived during the write stays pending
+                    if self._pending.get(path, _MISSING) is text:
+                        del self._pending[path]
+            with self._lock:
+                # Retry failed writes without waiting for another save
+                if self._pending and self.flush_delay > 0:
+                    self._arm_timer()
+
+    def load_token(self, server_id, corporation_id):
+        return self._read(self.token_path(server_id, corporation_id))
+
+    def save_token(self, server_id, corporation_id, token_data):
+        self._write(self.token_path(server_id, corporation_id), token_data)
+
+    def load_structures(self, server_id, corporation_id):
+        return self._read(self.structures_path(server_id, corporation_id))
+
+    def save_structures(self, server_id, corporation_id, server_structures):
+        self._write(self.structures_path(server_id, corporation_id), server_structures)
+
+    def load_goo(self, server_id):
+        return self._read(self.goo_path(server_id))
+
+    def save_goo(self, server_id, holdings):
+        self._write(self.goo_path(server_id), holdings)
+
+    def load_alert_channels(self):
+        return self._read(self.alert_channel_file) or {}
+
+    def save_alert_channels(self, alert_channels):
+        self._write(self.alert_channel_file, alert_channels)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    server_id TEXT NOT NULL,
+    corporation_id TEXT NOT NULL,
+    access_token TEXT,
+    refresh_token TEXT,
+    expires_in INTEGER,
+    created_at TEXT,
+    character_id INTEGER,
+    PRIMARY KEY (server_id, corporation_id)
+);
+CREATE TABLE IF NOT EXISTS structure_sets (
+    server_id TEXT NOT NULL,
+    corporation_id TEXT NOT NULL,
+    extra TEXT,
+    PRIMARY KEY (server_id, corporation_id)
+);
+CREATE TABLE IF NOT EXISTS structures (
+    server_id TEXT NOT NULL,
+    corporation_id TEXT NOT NULL,
+    structure_id TEXT NOT NULL,
+    name TEXT,
+    PRIMARY KEY (server_id, corporation_id, structure_id)
+);
+CREATE TABLE IF NOT EXISTS drills (
+    server_id TEXT NOT NULL,
+    corporation_id TEXT NOT NULL,
+    structure_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (server_id, corporation_id, structure_id)
+);
+CREATE INDEX IF NOT EXISTS drills_by_structure ON drills (structure_id);
+CREATE TABLE IF NOT EXISTS goo_holdings (
+    server_id TEXT NOT NULL,
+    structure TEXT NOT NULL,
+    item_name TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (server_id, structure, item_name)
+);
+CREATE TABLE IF NOT EXISTS alert_settings (
+    server_id TEXT PRIMARY KEY,
+    channel_id TEXT NOT NULL
+);
+"""
+
+
+class SQLiteStorage:
+    """All guild state in one SQLite database in WAL mode.
+
+    Each thread (event loop, Flask, to_thread workers) gets its own
+    connection, so readers never wait for a writer. Saves replace the rows
+    of one server/corporation in a single transaction.
+    """
+
+    def __init__(self, path='moongoo.db'):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def list_entries(self):
+        connection = self._connect()
+        for server_id, corporation_id in connection.execute('SELECT server_id, corporation_id FROM tokens ORDER BY server_id, corporation_id'):
+            yield 'token', server_id, corporation_id
+        for server_id, corporation_id in connection.execute('SELECT server_id, corporation_id FROM structure_sets ORDER BY server_id, corporation_id'):
+            yield 'structures', server_id, corporation_id
+        for (server_id,) in connection.execute('SELECT DISTINCT server_id FROM goo_holdings'):
+            yield 'goo', server_id, None
+
+    def load_token(self, server_id, corporation_id):
+        row = self._connect().execute(
+            f"SELECT {', '.join(TOKEN_FIELDS)} FROM tokens WHERE server_id = ? AND corporation_id = ?",
+            (str(server_id), str(corporation_id))
+        ).fetchone()
+        return dict(zip(TOKEN_FIELDS, row)) if row else None
+
+    def save_token(self, server_id, corporation_id, token_data):
+        with self._connect() as connection:
+            connection.execute(
+                f"INSERT OR REPLACE INTO tokens (server_id, corporation_id, {', '.join(TOKEN_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(server_id), str(corporation_id), *(token_data.get(field) for field in TOKEN_FIELDS))
+            )
+
+    def load_structures(self, server_id, corporation_id):
+        key = (str(server_id), str(corporation_id))
+        connection = self._connect()
+        row = connection.execute('SELECT extra FROM structure_sets WHERE server_id = ? AND corporation_id = ?', key).fetchone()
+        if row is None:
+            return None
+
+        server_structures = json.loads(row[0]) if row[0] else {}
+        server_structures['structure_info'] = dict(connection.execute(
+            'SELECT structure_id, name FROM structures WHERE server_id = ? AND corporation_id = ?', key))
+        server_structures['metenox_moon_drill_ids'] = [structure_id for (structure_id,) in connection.execute(
+            'SELECT structure_id FROM drills WHERE server_id = ? AND corporation_id = ? ORDER BY position', key)]
+        return server_structures
+
+    def save_structures(self, server_id, corporation_id, server_structures):
+        key = (str(server_id), str(corporation_id))
+        extra = {name: value for name, value in server_structures.items() if name not in STRUCTURE_KEYS}
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO structure_sets (server_id, corporation_id, extra) VALUES (?, ?, ?)',
+                               (*key, json.dumps(extra) if extra else None))
+            connection.execute('DELETE FROM structures WHERE server_id = ? AND corporation_id = ?', key)
+            connection.executemany('INSERT INTO structures (server_id, corporation_id, structure_id, name) VALUES (?, ?, ?, ?)',
+                                   [(*key, str(structure_id), name) for structure_id, name in server_structures.get('structure_info', {}).items()])
+            connection.execute('DELETE FROM drills WHERE server_id = ? AND corporation_id = ?', key)
+            connection.executemany('INSERT OR IGNORE INTO drills (server_id, corporation_id, structure_id, position) VALUES (?, ?, ?, ?)',
+                                   [(*key, int(structure_id), position) for position, structure_id in enumerate(server_structures.get('metenox_moon_drill_ids', []))])
+
+    def load_goo(self, server_id):
+        rows = self._connect().execute(
+            'SELECT structure, item_name, quantity FROM goo_holdings WHERE server_id = ? ORDER BY position', (str(server_id),))
+        holdings = {}
+        for structure, item_name, quantity in rows:
+            holdings.setdefault(structure, {})[item_name] = quantity
+        return holdings or None
+
+    def save_goo(self, server_id, holdings):
+        rows = []
+        for structure, items in holdings.items():
+            for item_name, quantity in items.items():
+                rows.append((str(server_id), structure, item_name, quantity, len(rows)))
+        with self._connect() as connection:
+            connection.execute('DELETE FROM goo_holdings WHERE server_id = ?', (str(server_id),))
+            connection.executemany('INSERT INTO goo_holdings (server_id, structure, item_name, quantity, position) VALUES (?, ?, ?, ?, ?)', rows)
+
+    def flush(self):
+        # Every save is committed right away
+        pass
+
+    def load_alert_channels(self):
+        return dict(self._connect().execute('SELECT server_id, channel_id FROM alert_settings'))
+
+    def save_alert_channels(self, alert_channels):
+        # Only rows that changed are written
+        current = self.load_alert_channels()
+        with self._connect() as connection:
+            connection.executemany('INSERT OR REPLACE INTO alert_settings (server_id, channel_id) VALUES (?, ?)',
+                                   [(str(server_id), str(channel_id)) for server_id, channel_id in alert_channels.items()
+                                    if current.get(str(server_id)) != str(channel_id)])
+            connection.executemany('DELETE FROM alert_settings WHERE server_id = ?',
+                                   [(server_id,) for server_id in current if server_id not in alert_channels])
+
+
+def create_storage(backend='json', database='moongoo.db', flush_delay=1.0):
+    """Storage backend selected by `storage_backend` in config.yaml (json or sqlite)."""
+    if backend == 'sqlite':
+        logging.info(f"Using SQLite storage ({database}).")
+        storage = SQLiteStorage(database)
+        if not any(True for _ in storage.list_entries()) and any(True for _ in JsonStorage().list_entries()):
+            logging.warning(f"{database} is empty but JSON state files exist, run 'python storage.py import-json' to copy them.")
+        return storage
+    if backend != 'json':
+        logging.warning(f"Unknown storage_backend '{backend}', using json.")
+    storage = JsonStorage(flush_delay=flush_delay)
+    # Pending saves must not be lost on shutdown
+    atexit.register(storage.flush)
+    return storage
+
+
+def import_json_state(source, target):
+    """Copy every token, structures set, goo snapshot and alert channel from source into target."""
+    counts = {'token': 0, 'structures': 0, 'goo': 0}
+    for kind, server_id, corporation_id in source.list_entries():
+        try:
+            if kind == 'token':
+                data = source.load_token(server_id, corporation_id)
+                if data:
+                    target.save_token(server_id, corporation_id, data)
+            elif kind == 'structures':
+                data = source.load_structures(server_id, corporation_id)
+                if data is not None:
+                    target.save_structures(server_id, corporation_id, data)
+            else:
+                data = source.load_goo(server_id)
+                if data:
+                    target.save_goo(server_id, data)
+            counts[kind] += 1
+        except ValueError as e:
+            logging.error(f"Skipping invalid {kind} data of server {server_id}: {e}")
+
+    alert_channels = source.load_alert_channels()
+    target.save_alert_channels(alert_channels)
+    target.flush()
+    logging.info(f"Imported {counts['token']} tokens, {counts['structures']} structure sets, "
+                 f"{counts['goo']} goo snapshots and {len(alert_channels)} alert channels.")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dr.MoonGoo state storage tools")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    import_parser = subcommands.add_parser('import-json', help="copy the JSON state files into the SQLite database")
+    import_parser.add_argument('--database', default='moongoo.db')
+    import_parser.add_argument('--directory', default='.')
+    args = parser.parse_args()
+
+    if args.command == 'import-json':
+        import_json_state(JsonStorage(args.directory), SQLiteStorage(args.database))
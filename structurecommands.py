@@ -1,21 +1,20 @@
-import json
 import logging
 import discord
 from discord.ext import commands
 import aiohttp
-import os
 import asyncio
+import time
 from administration import get_access_token, extract_corporation_id_from_filename
-from config import save_server_structures, load_server_structures
+from esi import esi_client
+from assets import asset_snapshots
+from names import name_resolver
+from config import save_server_structures, load_server_structures, get_config
+from bot_statistics import record_timing
+
+STRUCTURE_REFRESH_CONCURRENCY = get_config('structure_refresh_concurrency', 10)
 
 def load_structures(server_id, corporation_id):
-    file_path = f"{server_id}_{corporation_id}_structures.json"
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            return data.get("structure_info", {})
-    else:
-        return {}
+    return load_server_structures(server_id, corporation_id).get("structure_info", {})
 
 async def create_structure_select_menu(interaction: discord.Interaction):
     server_id = str(interaction.guild.id)
@@ -33,9 +32,6 @@ async def create_structure_select_menu(interaction: discord.Interaction):
 
 
 def add_or_update_server(server_id, corporation_id, structure_info):
-    # Define the filename based on the server and corporation ID
-    filename = f"{server_id}_{corporation_id}_structures.json"
-    
     # Structure the data to only include 'structure_info'
     server_structures = {
         'structure_info': structure_info
@@ -43,13 +39,20 @@ def add_or_update_server(server_id, corporation_id, structure_info):
 
     # Save the updated structure data
     try:
-        with open(filename, 'w') as file:
-            json.dump(server_structures, file, indent=4)
-        logging.info(f"Structures for server {server_id} and corporation {corporation_id} saved to {filename}.")
+        save_server_structures(server_structures, server_id, corporation_id)
+        logging.info(f"Structures for server {server_id} and corporation {corporation_id} saved.")
     except Exception as e:
-        logging.error(f"Error saving structures to file {filename}: {str(e)}")
+        logging.error(f"Error saving structures for server {server_id} and corporation {corporation_id}: {str(e)}")
+
+async def update_structure_info(server_id, moon_drill_ids, refresh=False):
+    """Resolve the names of the given moon drills and store them in the structures file.
 
-async def update_structure_info(server_id, moon_drill_ids):
+    Known names are kept unless refresh is set, in which case every drill is
+    looked up again (e.g. to pick up renamed structures). Lookups run
+    concurrently, bounded by structure_refresh_concurrency, and the results
+    are written with a single save.
+    """
+    started = time.perf_counter()
     corporation_id = extract_corporation_id_from_filename(server_id)
     if not corporation_id:
         logging.error(f"Failed to extract corporation ID for server {server_id}.")
@@ -61,123 +64,96 @@ async def update_structure_info(server_id, moon_drill_ids):
         return
 
     headers = {'Authorization': f'Bearer {access_token}'}
-    structure_info = load_server_structures(server_id, corporation_id)  # Load existing structures
-
-    async with aiohttp.ClientSession() as session:
-        for structure_id in moon_drill_ids:
-            if str(structure_id) not in structure_info:  # Avoid re-fetching existing structure names
-                url = f'https://esi.evetech.net/latest/universe/structures/{structure_id}/'
-
-                try:
-                    async with session.get(url, headers=headers) as response:
-                        if response.status == 200:
-                            data = await response.json()
-
-                            if 'name' in data:
-                                structure_name = data['name']
-                                structure_info[str(structure_id)] = structure_name
-                                logging.info(f"Fetched structure name for ID {structure_id}: {structure_name}")
-                            else:
-                                structure_info[str(structure_id)] = 'Unknown Structure'
-                                logging.error(f"Unexpected response format for structure ID {structure_id}: {data}")
-                        else:
-                            structure_info[str(structure_id)] = 'Unknown Structure'
-                            logging.error(f"Failed to fetch structure data for ID {structure_id}: HTTP {response.status}")
-                except aiohttp.ClientError as e:
-                    structure_info[str(structure_id)] = 'Unknown Structure'
-                    logging.error(f"Request error for structure ID {structure_id}: {e}")
+    structure_info = load_server_structures(server_id, corporation_id).get('structure_info', {})  # Load existing structures
+    if refresh:
+        # Drop drills that are gone, their names would otherwise linger in the saved structures
+        current_ids = {int(structure_id) for structure_id in moon_drill_ids}
+        structure_info = {structure_id: name for structure_id, name in structure_info.items() if int(structure_id) in current_ids}
+
+    # Avoid re-fetching existing structure names unless a full refresh was requested
+    lookup_ids = [structure_id for structure_id in moon_drill_ids if refresh or str(structure_id) not in structure_info]
+    if lookup_ids:
+        names = await name_resolver.resolve_structures(lookup_ids, headers, concurrency=STRUCTURE_REFRESH_CONCURRENCY, refresh=refresh)
+        for structure_id in lookup_ids:
+            structure_name = names.get(int(structure_id))
+            if structure_name:
+                logging.info(f"Fetched structure name for ID {structure_id}: {structure_name}")
+                structure_info[str(structure_id)] = structure_name
+            elif str(structure_id) not in structure_info:
+                structure_info[str(structure_id)] = 'Unknown Structure'
 
     # Update structure information in the file
     save_server_structures({'structure_info': structure_info, 'metenox_moon_drill_ids': moon_drill_ids}, server_id, corporation_id)
     logging.info(f"Saved updated structure info for server {server_id} and corporation {corporation_id}")
 
+    elapsed = time.perf_counter() - started
+    record_timing('structure_info_refresh', elapsed)
+    logging.info(f"Structure info refresh for server {server_id}: {len(lookup_ids)} lookups in {elapsed:.2f}s")
+
     
-async def get_all_structure_assets(structure_ids, server_id):
-    corporation_id = extract_corporation_id_from_filename(server_id)
-    
-    # Assuming get_access_token is synchronous
-    access_token = get_access_token(server_id, corporation_id)
-    
-    if not access_token:
-        logging.error('Failed to get access token')
-        return 'Failed to get access token'
-    
-    headers = {'Authorization': f'Bearer {access_token}'}
-    url = f'https://esi.evetech.net/latest/corporations/{corporation_id}/assets/?datasource=tranquility'
-    
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers, timeout=10) as response:
-                response.raise_for_status()
-                data = await response.json()
-                
-        except aiohttp.ClientError as e:
-            logging.error(f"Exception occurred during request: {str(e)}")
-            return f"Exception occurred during request: {e}"
-        except asyncio.TimeoutError:
-            logging.error("get_all_structure_assets: Request timed out")
-            return "Request timed out"
+async def get_all_structure_assets(structure_ids, server_id, corporation_id=None):
+    if not corporation_id:
+        corporation_id = extract_corporation_id_from_filename(server_id)
     
-    if isinstance(data, list):
-        all_assets = {}
-        for asset in data:
-            structure_id = asset.get('location_id')
-            if structure_id in structure_ids:
-                if structure_id not in all_assets:
-                    all_assets[structure_id] = []
-                all_assets[structure_id].append(asset)
-        return all_assets
+    try:
+        snapshot = await asset_snapshots.get(server_id, corporation_id)
+    except ValueError as e:
+        logging.error(str(e))
+        return str(e)
+    except aiohttp.ClientError as e:
+        logging.error(f"Exception occurred during request: {str(e)}")
+        return f"Exception occurred during request: {e}"
+    except asyncio.TimeoutError:
+        logging.error("get_all_structure_assets: Request timed out")
+        return "Request timed out"
     
-    logging.error("Unexpected API response format")
-    return "Unexpected API response format"
+    return snapshot.group(structure_ids)
 
 
 async def get_moon_drills(server_id):
+    """Return the IDs of the corporation's moon drills, an empty list if it has none and None if ESI failed."""
     corporation_id = extract_corporation_id_from_filename(server_id)
     if not corporation_id:
         logging.error(f"No corporation ID available for server {server_id}.")
-        return []
+        return None
 
     # Call get_access_token without await since it's not async
     access_token = get_access_token(server_id, corporation_id)
     if not access_token:
         logging.error(f"No access token available for server {server_id}. Cannot fetch moon drills.")
-        return []
+        return None
 
     headers = {'Authorization': f'Bearer {access_token}'}
     url = f'https://esi.evetech.net/latest/corporations/{corporation_id}/structures/?datasource=tranquility'
 
     logging.debug(f"Fetching moon drills for server {server_id} from URL: {url} with headers: {headers}")
 
-    async with aiohttp.ClientSession() as session:
-        for attempt in range(3):
-            try:
-                async with session.get(url, headers=headers) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-
-                    if 'error' in data:
-                        logging.error(f"Error fetching moon drills for server {server_id}: {data['error']}")
-                        return []
-
-                    moon_drill_ids = [
-                        structure['structure_id']
-                        for structure in data
-                        if structure['type_id'] == 35835 or 'Automatic Moon Drilling' in [service['name'] for service in structure.get('services', [])]
-                    ]
-
-                    logging.info(f"Fetched moon drills for server {server_id}: {moon_drill_ids}")
-                    return moon_drill_ids
-            except aiohttp.ClientError as e:
-                logging.error(f"Request error for server {server_id} (attempt {attempt + 1}/3): {e}")
-                if attempt < 2:
-                    logging.info("Retrying...")
-            except asyncio.TimeoutError as e:
-                logging.error(f"Request timed out for server {server_id} (attempt {attempt + 1}/3): {e}")
-                if attempt < 2:
-                    logging.info("Retrying...")
-        logging.error(f"All attempts to fetch moon drills for server {server_id} failed.")
-        return []
+    for attempt in range(3):
+        try:
+            data, _ = await esi_client.get_json(url, headers=headers)
+
+            if 'error' in data:
+                logging.error(f"Error fetching moon drills for server {server_id}: {data['error']}")
+                return None
+
+            moon_drill_ids = [
+                structure['structure_id']
+                for structure in data
+                if structure['type_id'] == 35835 or 'Automatic Moon Drilling' in [service['name'] for service in structure.get('services', [])]
+            ]
+
+            logging.info(f"Fetched moon drills for server {server_id}: {moon_drill_ids}")
+            return moon_drill_ids
+        except aiohttp.ClientError as e:
+            logging.error(f"Request error for server {server_id} (attempt {attempt + 1}/3): {e}")
+            if attempt < 2:
+                logging.info("Retrying...")
+        except asyncio.TimeoutError as e:
+            logging.error(f"Request timed out for server {server_id} (attempt {attempt + 1}/3): {e}")
+            if attempt < 2:
+                logging.info("Retrying...")
+    logging.error(f"All attempts to fetch moon drills for server {server_id} failed.")
+    return None
 
 
 async def get_structure_info(server_id, structure_id):
@@ -196,29 +172,26 @@ async def get_structure_info(server_id, structure_id):
     
     logging.info(f"Fetching structure info for server {server_id} and structure {structure_id} from URL: {url}")
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                data = await response.json()
-
-                if 'name' in data:
-                    structure_name = data['name']
-                    logging.info(f"Successfully fetched structure info for server {server_id}, ID {structure_id}: {structure_name}")
-                    return f"Structure ID: {structure_id}\nStructure Name: {structure_name}"
-                else:
-                    logging.error(f"Unexpected response format for server {server_id}, ID {structure_id}: {data}")
-                    return f"Structure ID: {structure_id}\nError: Unexpected response format. No 'name' field found."
-
-        except aiohttp.ClientError as e:
-            logging.error(f"Request error for server {server_id}, structure ID {structure_id}: {e}")
-            return f"Structure ID: {structure_id}\nError: Failed to retrieve structure info."
-        except aiohttp.http_exceptions.HttpProcessingError as e:
-            logging.error(f"HTTP processing error for server {server_id}, structure ID {structure_id}: {e}")
-            return f"Structure ID: {structure_id}\nError: HTTP processing error."
-        except Exception as e:
-            logging.error(f"Unexpected error for server {server_id}, structure ID {structure_id}: {e}")
-            return f"Structure ID: {structure_id}\nError: An unexpected error occurred."
+    try:
+        data, _ = await esi_client.get_json(url, headers=headers)
+
+        if 'name' in data:
+            structure_name = data['name']
+            logging.info(f"Successfully fetched structure info for server {server_id}, ID {structure_id}: {structure_name}")
+            return f"Structure ID: {structure_id}\nStructure Name: {structure_name}"
+        else:
+            logging.error(f"Unexpected response format for server {server_id}, ID {structure_id}: {data}")
+            return f"Structure ID: {structure_id}\nError: Unexpected response format. No 'name' field found."
+
+    except aiohttp.ClientError as e:
+        logging.error(f"Request error for server {server_id}, structure ID {structure_id}: {e}")
+        return f"Structure ID: {structure_id}\nError: Failed to retrieve structure info."
+    except aiohttp.http_exceptions.HttpProcessingError as e:
+        logging.error(f"HTTP processing error for server {server_id}, structure ID {structure_id}: {e}")
+        return f"Structure ID: {structure_id}\nError: HTTP processing error."
+    except Exception as e:
+        logging.error(f"Unexpected error for server {server_id}, structure ID {structure_id}: {e}")
+        return f"Structure ID: {structure_id}\nError: An unexpected error occurred."
 
 
 
@@ -239,20 +212,17 @@ async def get_structure_name(server_id, structure_id):
 
     logging.info(f"Fetching structure name for server {server_id} and structure {structure_id} from URL: {url} with headers: {headers} and token: {access_token}")
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                data = await response.json()
-
-                if 'error' in data:
-                    logging.error(f"Error fetching structure name for server {server_id}: {data['error']}")
-                    return f"Error fetching structure name for ID {structure_id}: {data.get('error', 'Unknown error')}"
-                
-                structure_name = data.get('name', 'Unknown Structure')
-                return structure_name
-        except aiohttp.ClientError as e:
-            logging.error(f"Request error for server {server_id}: {e}")
-            return 'Unknown Structure'
+    try:
+        data, _ = await esi_client.get_json(url, headers=headers)
+
+        if 'error' in data:
+            logging.error(f"Error fetching structure name for server {server_id}: {data['error']}")
+            return f"Error fetching structure name for ID {structure_id}: {data.get('error', 'Unknown error')}"
+            
+        structure_name = data.get('name', 'Unknown Structure')
+        return structure_name
+    except aiohttp.ClientError as e:
+        logging.error(f"Request error for server {server_id}: {e}")
+        return 'Unknown Structure'
 
       
\ No newline at end of file
@@ -4,11 +4,9 @@ from config import save_server_structures, load_server_structures
 from structurecommands import get_moon_drills
 from discord.ext import tasks
 from administration import refresh_all_tokens
-from scheduler import run_alert_scheduler
-import os
+from scheduler import alert_scheduler
+from registry import registry
 from mongodatabase import collect_moon_goo_data_and_save
-from market_calculation import fetch_market_stats_for_items
-import json
 
 # Task to refresh all tokens
 @tasks.loop(minutes=5)
@@ -18,31 +16,11 @@ async def refresh_token_task():
     except Exception as e:
         logging.error(f"Task failed to refresh tokens!: {str(e)}")
 
-@tasks.loop(hours=6)
-async def fetch_market_stats_task():
-    try:
-        await fetch_market_stats_for_items()
-    except Exception as e:
-        logging.error(f"Exception in fetch_market_stats_task: {str(e)}")
-
-@tasks.loop(minutes=1) 
-async def alert_scheduler_task(bot):
-    all_server_ids = [f.split('_')[0] for f in os.listdir('.') if f.endswith("_structures.json")]
-    for server_id in all_server_ids:
-        await run_alert_scheduler(bot, server_id)
-
-async def start_alert_scheduler(bot):
-    if not alert_scheduler_task.is_running():
-        logging.info("Starting alert_scheduler_task.")
-        alert_scheduler_task.start(bot)  # Pass the bot instance to the task
-
-
 @tasks.loop(minutes=60)
 async def save_data_to_mongodb_task():
     try:
         # Load all server IDs (assuming these are stored in a config or accessible in some other way)
-        all_server_ids = [f.split('_')[0] for f in os.listdir('.') if f.endswith("_structures.json")]
-        unique_server_ids = list(set(all_server_ids))
+        unique_server_ids = {server_id for server_id, _ in registry.structure_targets()}
 
         for server_id in unique_server_ids:
             # Check if MongoDB integration is enabled for this server
@@ -64,29 +42,23 @@ async def save_data_to_mongodb_task():
 @tasks.loop(minutes=30)
 async def update_moondrills_task():
     try:
-        # Get server IDs from structure files
-        all_server_ids = {f.split('_')[0] for f in os.listdir('.') if f.endswith("_structures.json")}
+        # Get server IDs with saved structures from the registry
+        all_server_ids = {server_id for server_id, _ in registry.structure_targets()}
         
         for server_id in all_server_ids:
             try:
-                # Collect all structure files for the server (e.g., {server_id}_{corporation_id}_structures.json)
-                structure_files = [f for f in os.listdir('.') if f.startswith(f"{server_id}_") and f.endswith("_structures.json")]
+                # Corporations of the server with saved structures
+                corporation_ids = registry.structure_corporations(server_id)
 
-                if not structure_files:
-                    logging.debug(f"No structure info files found for server {server_id}.")
+                if not corporation_ids:
+                    logging.debug(f"No structure info found for server {server_id}.")
                     continue
 
-                # Loop through each corporation's structure file
-                for structure_file in structure_files:
-                    # Extract corporation ID from the file name (assuming format {server_id}_{corporation_id}_structures.json)
-                    corporation_id = structure_file.replace(f"{server_id}_", "").replace("_structures.json", "")
-
-                    # Load the structure info for the corporation from JSON
-                    try:
-                        with open(structure_file, 'r') as file:
-                            server_structures = json.load(file)
-                    except (FileNotFoundError, json.JSONDecodeError) as e:
-                        logging.error(f"Error loading or parsing {structure_file}: {e}")
+                # Loop through each corporation's structures
+                for corporation_id in corporation_ids:
+                    # Load the structure info for the corporation
+                    server_structures = load_server_structures(server_id, corporation_id)
+                    if not server_structures:
                         continue
                     
                     # Get moon drill structure IDs for the current server
@@ -98,7 +70,7 @@ async def update_moondrills_task():
                         # Update the moon drill IDs in the server structures
                         server_structures['metenox_moon_drill_ids'] = moon_drill_ids
 
-                        # Save the updated server structures back to the JSON file
+                        # Save the updated server structures
                         save_server_structures(server_structures, server_id, corporation_id)
                     else:
                         logging.debug(f"No moon drills found or an error occurred for server {server_id} and corporation {corporation_id}.")
@@ -122,9 +94,5 @@ def start_tasks(bot):
     if not save_data_to_mongodb_task.is_running():
         logging.info("Starting save_data_to_mongodb_task.")
         save_data_to_mongodb_task.start()
-    if not fetch_market_stats_task.is_running():
-        logging.info("Starting fetch_market_stats_task.")
-        fetch_market_stats_task.start()
-    if not alert_scheduler_task.is_running():  # Check if the alert scheduler is running
-        logging.info("Starting alert_scheduler_task.")
-        alert_scheduler_task.start(bot)
\ No newline at end of file
+    # One scheduler for the alerts of every server, started only once across reconnects
+    alert_scheduler.start(bot)
\ No newline at end of file
@@ -0,0 +1,85 @@
+import numpy as np
+from moongoo import get_moon_goo_items
+
+# Fixed column order of the goo matrix
+GOO_NAMES = list(get_moon_goo_items().values())
+GOO_COLUMNS = {name: column for column, name in enumerate(GOO_NAMES)}
+
+def corporation_from_label(structure_label):
+    """Goo holdings are keyed "<corporation> - <structure>", return the corporation part."""
+    return structure_label.split(' - ', 1)[0]
+
+def price_vectors(price_table):
+    """Return (buy, sell) unit price vectors aligned with GOO_NAMES."""
+    prices = [price_table.prices(name) for name in GOO_NAMES]
+    buy = np.array([price[0] or 0 for price in prices], dtype=np.float64)
+    sell = np.array([price[1] or 0 for price in prices], dtype=np.float64)
+    return buy, sell
+
+
+class GooValuation:
+    """Values moon goo holdings as a structures x goo-types matrix.
+
+    holdings is the {structure_label: {item_name: quantity}} dict stored in
+    {server_id}_metenox_goo.json. value() multiplies the quantity matrix with
+    the buy/sell price vectors once and derives the per-structure,
+    per-corporation and guild totals from that single pass.
+    """
+
+    def __init__(self, holdings):
+        self.structures = list(holdings)
+        self.quantities = np.zeros((len(self.structures), len(GOO_NAMES)), dtype=np.float64)
+        self.unknown_items = set()
+
+        for row, items in enumerate(holdings.values()):
+            for item_name, amount in items.items():
+                column = GOO_COLUMNS.get(item_name)
+                if column is None:
+                    self.unknown_items.add(item_name)
+                    continue
+                self.quantities[row, column] += amount
+
+        corporation_labels = [corporation_from_label(label) for label in self.structures]
+        self.corporations, self._corporation_index = np.unique(corporation_labels, return_inverse=True)
+
+    def value(self, price_table):
+        self.buy_prices, self.sell_prices = price_vectors(price_table)
+
+        # Per cell values, then every total is a reduction of these two matrices
+        self.buy_values = self.quantities * self.buy_prices
+        self.sell_values = self.quantities * self.sell_prices
+
+        self.structure_buy = self.buy_values.sum(axis=1)
+        self.structure_sell = self.sell_values.sum(axis=1)
+
+        corporation_count = len(self.corporations)
+        self.corporation_buy = np.bincount(self._corporation_index, weights=self.structure_buy, minlength=corporation_count)
+        self.corporation_sell = np.bincount(self._corporation_index, weights=self.structure_sell, minlength=corporation_count)
+
+        self.guild_buy = float(self.structure_buy.sum())
+        self.guild_sell = float(self.structure_sell.sum())
+        return self
+
+    def item_values(self, row, item_name):
+        """Return (buy, sell) value of one item in one structure row."""
+        column = GOO_COLUMNS[item_name]
+        return float(self.buy_values[row, column]), float(self.sell_values[row, column])
+
+    def corporation_totals(self):
+        return {
+            str(corporation): (float(self.corporation_buy[i]), float(self.corporation_sell[i]))
+            for i, corporation in enumerate(self.corporations)
+        }
+
+    def rows(self):
+        """Non-empty (structure, item) cells as column arrays, e.g. for a DataFrame."""
+        structure_index, item_index = np.nonzero(self.quantities)
+        return {
+            'Station': np.array(self.structures, dtype=object)[structure_index],
+            'Item': np.array(GOO_NAMES, dtype=object)[item_index],
+            'Quantity': self.quantities[structure_index, item_index].astype(np.int64),
+            'Buy Price (Unit)': self.buy_prices[item_index],
+            'Sell Price (Unit)': self.sell_prices[item_index],
+            'Total Buy Value': self.buy_values[structure_index, item_index],
+            'Total Sell Value': self.sell_values[structure_index, item_index],
+        }